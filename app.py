@@ -1,17 +1,49 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import asyncio
+import io
 import json
+import logging
+import os
 from improved import UltimateScheduler  # Import backend kita
 
+# Worker pool untuk pipeline CPU-bound + SQLite, supaya event loop (dan /health) tetap responsif
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+
+# Executor + scheduler dibuat di lifespan, bukan saat import: day pool (spawn) meng-import ulang __main__,
+# dan process anak tidak boleh membuka database / history writer sendiri
+executor: Optional[ThreadPoolExecutor] = None
+scheduler: Optional[UltimateScheduler] = None
+
+async def run_in_pool(func, *args):
+    """Jalankan fungsi blocking di worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global executor, scheduler
+    executor = ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS, thread_name_prefix="scheduler")
+    scheduler = create_scheduler()
+    yield
+    executor.shutdown(wait=True)
+    # Drain history queue sebelum connection ditutup
+    scheduler.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Smart Scheduler API",
     description="Intelligent scheduling system dengan NLP-powered context understanding",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for frontend
@@ -23,21 +55,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize scheduler
-scheduler = UltimateScheduler()
+# Diagnostics engine lewat logging (default hanya warning ke atas)
+logging.basicConfig(level=os.getenv("SCHEDULER_LOG_LEVEL", "WARNING").upper())
+
+# Write-behind history: response tidak menunggu commit SQLite (0 = tulis sinkron)
+HISTORY_QUEUE_SIZE = int(os.getenv("SCHEDULER_HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_BATCH_SIZE = int(os.getenv("SCHEDULER_HISTORY_BATCH_SIZE", "100"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("SCHEDULER_HISTORY_FLUSH_INTERVAL", "0.5"))
+
+# Dashboard polling: analytics di-cache sekian detik (di-invalidate saat ada history write)
+ANALYTICS_CACHE_TTL = float(os.getenv("SCHEDULER_ANALYTICS_CACHE_TTL", "5"))
+
+# Cache hasil pipeline lengkap untuk request berulang (per sentence + tanggal)
+RESULT_CACHE_SIZE = int(os.getenv("SCHEDULER_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_MAX_MB = int(os.getenv("SCHEDULER_RESULT_CACHE_MAX_MB", "64"))
+
+# Process pool untuk plan multi-hari panjang (0 = serial); plan di bawah threshold hari tetap in-process
+DAY_WORKERS = int(os.getenv("SCHEDULER_DAY_WORKERS", "0"))
+PARALLEL_DAY_THRESHOLD = int(os.getenv("SCHEDULER_PARALLEL_DAY_THRESHOLD", "90"))
+
+# Optimal placement engine: time budget per request dalam ms (0 = greedy packer)
+PLACEMENT_BUDGET_MS = int(os.getenv("SCHEDULER_PLACEMENT_BUDGET_MS", "0"))
+
+# Timezone default untuk "hari ini" (kosong = local time server)
+SCHEDULER_TZ = os.getenv("SCHEDULER_TZ") or None
+
+def create_scheduler() -> UltimateScheduler:
+    """Scheduler headless: tanpa console rendering; parse cache untuk preview / autocomplete"""
+    return UltimateScheduler(parse_cache_size=1024, headless=True,
+                             history_queue_size=HISTORY_QUEUE_SIZE,
+                             history_batch_size=HISTORY_BATCH_SIZE,
+                             history_flush_interval=HISTORY_FLUSH_INTERVAL,
+                             analytics_cache_ttl=ANALYTICS_CACHE_TTL,
+                             result_cache_size=RESULT_CACHE_SIZE,
+                             result_cache_max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+                             tz=SCHEDULER_TZ,
+                             day_workers=DAY_WORKERS,
+                             parallel_day_threshold=PARALLEL_DAY_THRESHOLD,
+                             placement_budget_ms=PLACEMENT_BUDGET_MS)
 
 # Request model
+def validate_tz(tz: Optional[str]) -> Optional[str]:
+    if tz is not None:
+        try:
+            ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone: {tz}")
+    return tz
+
+MAX_HORIZON_DAYS = 366
+MAX_PLACEMENT_BUDGET_MS = 5000
+
 class ScheduleRequest(BaseModel):
     sentence: str
+    bypass_cache: bool = False
+    # Hari ke-0 jadwal; default "hari ini" di timezone tz (IANA, mis. "Asia/Jakarta")
+    reference_date: Optional[date] = None
+    tz: Optional[str] = None
+    # Panjang horizon untuk recurring ("setiap senin", "setiap hari")
+    horizon_days: int = Field(UltimateScheduler.RECURRENCE_HORIZON_DAYS, ge=1, le=MAX_HORIZON_DAYS)
+    # Time budget optimal placement engine (None = default server, 0 = greedy packer)
+    placement_budget_ms: Optional[int] = Field(None, ge=0, le=MAX_PLACEMENT_BUDGET_MS)
+
+    _check_tz = field_validator("tz")(validate_tz)
+
+class BatchScheduleRequest(BaseModel):
+    sentences: List[str]
+    bypass_cache: bool = False
+    reference_date: Optional[date] = None
+    tz: Optional[str] = None
+    horizon_days: int = Field(UltimateScheduler.RECURRENCE_HORIZON_DAYS, ge=1, le=MAX_HORIZON_DAYS)
+    placement_budget_ms: Optional[int] = Field(None, ge=0, le=MAX_PLACEMENT_BUDGET_MS)
+
+    _check_tz = field_validator("tz")(validate_tz)
+
+MAX_BATCH_SIZE = 1000
 
 # Response models
 class ScheduleResponse(BaseModel):
     success: bool
+    # uid stored schedule, untuk GET/PATCH /schedule/{schedule_id}
+    schedule_id: Optional[str] = None
     schedule: List[Dict]
     metrics: Dict
     conflicts_resolved: int = 0
     smart_suggestions: List[str] = []
     time_context: Dict = {}
+    # Hanya ada kalau optimal placement engine dipakai (engine, timed_out)
+    placement: Optional[Dict] = None
+    message: str = ""
+
+class BatchScheduleResponse(BaseModel):
+    success: bool
+    results: List[ScheduleResponse] = []
+    succeeded: int = 0
+    failed: int = 0
+    message: str = ""
+
+class ScheduleEditRequest(BaseModel):
+    op: str
+    # move / remove
+    event_id: Optional[int] = None
+    # add: name + start + (end | hours); move: start (durasi tetap kecuali end dikirim)
+    name: Optional[str] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    hours: Optional[float] = Field(None, gt=0)
+    priority: str = "medium"
+
+class ParseResponse(BaseModel):
+    success: bool
+    activities: List[Dict] = []
+    total_hours: float = 0
+    target_day: int = 0
+    day_reference: Optional[str] = None
+    recurring: Optional[Dict] = None
+    time_context: Dict = {}
     message: str = ""
 
 @app.get("/", response_class=HTMLResponse)
@@ -583,7 +716,9 @@ async def create_schedule(request: ScheduleRequest):
             raise HTTPException(status_code=400, detail="Sentence cannot be empty")
         
         # Use our enhanced backend scheduler
-        result = scheduler.ultimate_enhanced_blitz_mode(request.sentence)
+        result = await run_in_pool(scheduler.ultimate_enhanced_blitz_mode, request.sentence, request.reference_date,
+                                   not request.bypass_cache, request.tz, request.horizon_days,
+                                   request.placement_budget_ms)
         
         if not result:
             return ScheduleResponse(
@@ -595,11 +730,13 @@ async def create_schedule(request: ScheduleRequest):
         
         return ScheduleResponse(
             success=True,
+            schedule_id=result.get('schedule_id'),
             schedule=result.get('schedule', []),
             metrics=result.get('metrics', {}),
             conflicts_resolved=result.get('conflicts_resolved', 0),
             smart_suggestions=result.get('smart_suggestions', []),
-            time_context=result.get('time_context', {})
+            time_context=result.get('time_context', {}),
+            placement=result.get('placement')
         )
         
     except Exception as e:
@@ -610,19 +747,162 @@ async def create_schedule(request: ScheduleRequest):
             message=str(e)
         )
 
+@app.post("/schedule/batch", response_model=BatchScheduleResponse)
+async def create_schedule_batch(request: BatchScheduleRequest):
+    """Batch endpoint: banyak sentences dalam satu request, history disimpan dalam batched transaction"""
+    try:
+        if not request.sentences:
+            raise HTTPException(status_code=400, detail="Sentences cannot be empty")
+        if len(request.sentences) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_SIZE} sentences per batch")
+        
+        batch_results = await run_in_pool(scheduler.ultimate_enhanced_batch_mode, request.sentences,
+                                          request.reference_date, not request.bypass_cache, request.tz,
+                                          request.horizon_days, request.placement_budget_ms)
+        
+        results = []
+        for result in batch_results:
+            if not result['success']:
+                results.append(ScheduleResponse(success=False, schedule=[], metrics={}, message=result['error']))
+                continue
+            results.append(ScheduleResponse(
+                success=True,
+                schedule_id=result.get('schedule_id'),
+                schedule=result['schedule'],
+                metrics=result['metrics'],
+                conflicts_resolved=result['conflicts_resolved'],
+                smart_suggestions=result['smart_suggestions'],
+                time_context=result['time_context'],
+                placement=result.get('placement')
+            ))
+        
+        succeeded = sum(1 for result in results if result.success)
+        return BatchScheduleResponse(
+            success=True,
+            results=results,
+            succeeded=succeeded,
+            failed=len(results) - succeeded
+        )
+        
+    except Exception as e:
+        return BatchScheduleResponse(success=False, message=str(e))
+
+@app.get("/schedule/{schedule_id}")
+async def get_schedule(schedule_id: str):
+    """Stored schedule (events dengan id) untuk di-edit"""
+    schedule = await run_in_pool(scheduler.get_schedule, schedule_id)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"success": True, **schedule}
+
+@app.patch("/schedule/{schedule_id}")
+async def edit_schedule(schedule_id: str, request: ScheduleEditRequest):
+    """Incremental edit (add / move / remove satu event); return diff, bukan full schedule"""
+    try:
+        diff = await run_in_pool(scheduler.edit_schedule, schedule_id, request.model_dump(exclude_none=True))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **diff}
+
+@app.post("/parse", response_model=ParseResponse)
+async def parse_sentence(request: ScheduleRequest):
+    """Parse-only endpoint untuk preview / autocomplete (tanpa scheduling & database)"""
+    try:
+        if not request.sentence.strip():
+            raise HTTPException(status_code=400, detail="Sentence cannot be empty")
+        
+        preview = await run_in_pool(scheduler.parse_preview, request.sentence)
+        return ParseResponse(success=True, **preview)
+        
+    except Exception as e:
+        return ParseResponse(success=False, message=str(e))
+
 @app.get("/analytics")
-async def get_analytics():
-    """Get analytics dashboard data"""
+async def get_analytics(request: Request, response: Response):
+    """Get analytics dashboard data (ETag + Cache-Control untuk conditional polling)"""
+    try:
+        entry = await run_in_pool(scheduler.get_analytics_entry)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    
+    etag = f'"{entry["etag"]}"'
+    headers = {
+        "ETag": etag,
+        # Analytics global (tidak per user), jadi boleh disimpan shared cache / CDN
+        "Cache-Control": f"public, max-age={int(ANALYTICS_CACHE_TTL)}, must-revalidate"
+    }
+    # If-None-Match pakai weak comparison: proxy yang mengompres response mengubah ETag jadi W/"..."
+    if_none_match = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return {"success": True, "analytics": entry["analytics"]}
+
+MAX_EVENTS_LIMIT = 10000
+
+@app.get("/events")
+async def get_events(start: str, end: str, activity: Optional[str] = None, limit: int = 1000):
+    """Events yang mulai dalam [start, end) (ISO datetime), opsional difilter per activity"""
+    try:
+        start_time = datetime.fromisoformat(start).isoformat()
+        end_time = datetime.fromisoformat(end).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO datetimes")
+    if not 0 < limit <= MAX_EVENTS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_EVENTS_LIMIT}")
+    
+    try:
+        events = await run_in_pool(scheduler.query_events, start_time, end_time, activity, limit)
+        return {"success": True, "events": events}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+MAX_HISTORY_PAGE_SIZE = 1000
+
+@app.get("/history")
+async def get_history(after: Optional[int] = None, limit: int = 100, format: str = "json"):
+    """Schedule history dengan cursor pagination (`after` = next_cursor), atau export NDJSON streaming"""
+    if format == "ndjson":
+        # Generator sync di-iterate di threadpool; memory terbatas per chunk
+        lines = (json.dumps(item) + "\n" for item in scheduler.iter_history(after))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    if not 0 < limit <= MAX_HISTORY_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_HISTORY_PAGE_SIZE}")
+    
+    try:
+        page = await run_in_pool(scheduler.get_history_page, after, limit)
+        return {"success": True, **page}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.post("/history/import")
+async def import_history(file: UploadFile = File(...), format: Optional[str] = None):
+    """Bulk import history dari upload NDJSON / CSV (di-stream per chunk, rollups di-rebuild di akhir)"""
+    import_format = format or ('csv' if (file.filename or '').endswith('.csv') else 'ndjson')
+    if import_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    
     try:
-        analytics = scheduler.get_analytics()
-        return {"success": True, "analytics": analytics}
+        lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        summary = await run_in_pool(scheduler.import_history, lines, import_format)
+        return {"success": True, **summary}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "AI Smart Scheduler API"}
+    health = {"status": "healthy", "service": "AI Smart Scheduler API"}
+    if scheduler.analytics_cache:
+        health["analytics_cache"] = scheduler.analytics_cache.stats()
+    if scheduler.result_cache:
+        health["result_cache"] = scheduler.result_cache.stats()
+    return health
 
 if __name__ == "__main__":
     import uvicorn
@@ -3,15 +3,1138 @@
 #Recurring Events - Support "setiap senin", "setiap hari"
 #Smart Conflict Resolution - Auto detect dan resolve bentrok jadwal
 
+import copy
+import csv
+import hashlib
 import re
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
 import json
+import logging
+import multiprocessing
+import queue
 import sqlite3
+import threading
+import uuid
 from pathlib import Path
+from time import monotonic
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+Token = namedtuple('Token', ['kind', 'text', 'start', 'end'])
+
+MINUTES_PER_DAY = 24 * 60
+
+PRIORITY_WEIGHTS = {
+    'high': 3,
+    'medium': 2,
+    'low': 1
+}
+
+# Opsi optimal placement engine: windows = preferred ranges kalimat (menit dalam hari), day_budget = detik per hari
+PlacementOptions = namedtuple('PlacementOptions', ['windows', 'day_budget'])
+
+
+class TokenStream:
+    """Hasil satu kali scan kalimat: token + keyword hits per lexicon"""
+
+    def __init__(self, text: str, tokens: List[Token], hits: Dict[str, Dict[str, int]], tags: List[set]):
+        self.text = text
+        self.tokens = tokens
+        self.hits = hits    # lexicon -> {phrase: index token pertama}
+        self.tags = tags    # per token: set lexicon yang meng-cover token tsb
+
+    def found(self, lexicon: str) -> Dict[str, int]:
+        return self.hits.get(lexicon, {})
+
+    def time_ranges(self) -> List[Dict]:
+        """Pattern 'jam X-Y' / 'jam X Y' langsung dari token stream"""
+        ranges = []
+        tokens = self.tokens
+        for i, token in enumerate(tokens):
+            if token.text != 'jam' or i + 2 >= len(tokens) or tokens[i + 1].kind != 'number':
+                continue
+            j = i + 2
+            if tokens[j].text == '-' and j + 1 < len(tokens):
+                j += 1
+            if tokens[j].kind == 'number':
+                ranges.append({'start': int(tokens[i + 1].text), 'end': int(tokens[j].text)})
+        return ranges
+
+    def segments(self, drop: set) -> List[str]:
+        """Pecah token stream jadi activity strings, buang token yang di-cover lexicon di `drop`"""
+        segments = []
+        current = []
+        prev_end = None
+
+        for token, tags in zip(self.tokens, self.tags):
+            if token.kind == 'sep' or 'separator' in tags:
+                segments.append(''.join(current))
+                current = []
+                prev_end = None
+                continue
+            if tags & drop:
+                continue
+            if current and token.start != prev_end:
+                current.append(' ')
+            current.append(token.text)
+            prev_end = token.end
+
+        segments.append(''.join(current))
+        return segments
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton - semua keyword dari semua lexicon dicari dalam satu scan"""
 
-class UltimateScheduler:
     def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # per state: list (keyword, lexicon, label)
+
+    def add(self, keyword: str, lexicon: str, label):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((keyword, lexicon, label))
+
+    def build(self):
+        """Hitung failure links (BFS) - dipanggil sekali setelah semua keyword di-add"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def iter_matches(self, text: str):
+        """Yield (start, end, keyword, lexicon, label) untuk setiap keyword yang muncul sebagai substring"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, lexicon, label in output[state]:
+                yield end - len(keyword), end, keyword, lexicon, label
+
+    def hits(self, text: str) -> Dict[str, set]:
+        """Hit set {lexicon: set(label)} dari satu scan"""
+        found = {}
+        for _, _, _, lexicon, label in self.iter_matches(text):
+            found.setdefault(lexicon, set()).add(label)
+        return found
+
+
+class SentenceLexer:
+    """Precompiled lexer - satu pass per kalimat, dipakai bersama oleh semua tahap parsing"""
+
+    TOKEN_PATTERN = re.compile(r'(?P<number>\d+)|(?P<word>[^\W\d_]+)|(?P<sep>[,.])|(?P<symbol>\S)')
+
+    def __init__(self, automaton: KeywordAutomaton, lexicons: set):
+        self.automaton = automaton
+        self.lexicons = lexicons  # lexicon yang dicocokkan per kata utuh
+
+    def scan(self, sentence: str) -> TokenStream:
+        text = sentence.lower()
+        tokens = [Token(m.lastgroup, m.group(), m.start(), m.end()) for m in self.TOKEN_PATTERN.finditer(text)]
+        starts = {token.start: i for i, token in enumerate(tokens) if token.kind == 'word'}
+        ends = {token.end: i for i, token in enumerate(tokens) if token.kind == 'word'}
+        hits = {}
+        tags = [set() for _ in tokens]
+
+        for start, end, keyword, lexicon, _ in self.automaton.iter_matches(text):
+            # Hanya keyword yang jatuh tepat di batas kata
+            if lexicon not in self.lexicons or start not in starts or end not in ends:
+                continue
+            first, last = starts[start], ends[end]
+            hits.setdefault(lexicon, {}).setdefault(keyword, first)
+            for i in range(first, last + 1):
+                tags[i].add(lexicon)
+
+        return TokenStream(text, tokens, hits, tags)
+
+
+class ParseCache:
+    """Bounded LRU cache untuk hasil context_aware_parse (copy-on-read, thread-safe)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # Copy supaya caller bebas memodifikasi activities tanpa merusak cache
+        return copy.deepcopy(entry)
+
+    def put(self, key: str, value):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0
+        }
+
+
+class ResultCache:
+    """LRU cache untuk hasil pipeline lengkap (serialized), dibatasi jumlah entry & total bytes.
+    Disimpan sebagai JSON string: ukuran bisa dihitung pasti dan setiap get() menghasilkan copy baru."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key: Tuple, value: Dict):
+        payload = json.dumps(value)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self.entries[key] = payload
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / total if total else 0
+            }
+
+
+class AnalyticsCache:
+    """TTL cache untuk get_analytics(), di-invalidate setiap ada history write"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entry = None
+        self.version = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, loader) -> Dict:
+        """Return entry {'analytics', 'etag', 'created'}; loader() dipanggil kalau kosong / expired"""
+        with self.lock:
+            entry = self.entry
+            if entry is not None and monotonic() - entry['created'] < self.ttl:
+                self.hits += 1
+                return copy.deepcopy(entry)
+            self.misses += 1
+            version = self.version
+        
+        entry = self.make_entry(loader())
+        with self.lock:
+            # Write yang terjadi selama loader() jalan -> jangan simpan hasil yang mungkin stale
+            if version == self.version:
+                self.entry = entry
+        return copy.deepcopy(entry)
+
+    @staticmethod
+    def make_entry(analytics: Dict) -> Dict:
+        # ETag dari isi response, jadi tetap valid lintas restart / worker
+        body = json.dumps(analytics, sort_keys=True, default=str).encode()
+        return {'analytics': analytics, 'etag': hashlib.sha1(body).hexdigest(), 'created': monotonic()}
+
+    def invalidate(self):
+        with self.lock:
+            self.entry = None
+            self.version += 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'ttl': self.ttl,
+                'age': monotonic() - self.entry['created'] if self.entry else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / total if total else 0
+            }
+
+
+class HistoryWriter:
+    """Write-behind queue untuk schedule history: submit() langsung return, worker thread
+    flush ke database dalam batched transactions (batch_size entry atau flush_interval sejak entry pertama)"""
+
+    STOP = object()
+
+    def __init__(self, flush, max_queue_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 0.5, put_timeout: float = 1.0, key: Optional[Callable] = None):
+        self.flush_batch = flush
+        # key(entry) -> id entry; id yang masih di queue bisa dicek lewat is_pending() / ditunggu lewat wait_for()
+        self.key = key
+        self.pending_keys = {}
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.lock = threading.Lock()
+        # Terpisah dari lock counters: dipegang submit() selama put, worker tidak pernah mengambilnya
+        self.state_lock = threading.Lock()
+        self.closed = False
+        self.written = 0
+        self.failed = 0
+        self.sync_writes = 0
+        self.thread = threading.Thread(target=self.run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, entry: Tuple[str, List[Dict], Dict]):
+        """Antri satu entry; kalau queue penuh (block sampai put_timeout) atau writer sudah close, tulis sinkron"""
+        self.submit_many([entry])
+
+    def submit_many(self, entries: List[Tuple[str, List[Dict], Dict]]):
+        """Antri entries sebagai satu queue item: tidak pernah dipecah, selalu tertulis dalam transaction yang sama"""
+        if not entries:
+            return
+        with self.state_lock:
+            if not self.closed:
+                self.track(entries, pending=True)
+                try:
+                    self.queue.put(entries, timeout=self.put_timeout)
+                    return
+                except queue.Full:
+                    self.track(entries, pending=False)
+                    logger.warning("History queue full (%d), writing synchronously", self.queue.maxsize)
+        self.flush_batch(entries)
+        with self.lock:
+            self.sync_writes += 1
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            batch = []
+            markers = []
+            # Kumpulkan sampai batch_size, atau sampai flush_interval lewat sejak entry pertama;
+            # flush marker (threading.Event) menutup window lebih awal
+            window_end = monotonic() + self.flush_interval
+            while True:
+                if item is self.STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    batch.extend(item)
+                if stopping or markers or len(batch) >= self.batch_size:
+                    break
+                remaining = window_end - monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self.write(batch)
+            for marker in markers:
+                marker.set()
+
+    def track(self, entries: List[Tuple], pending: bool):
+        if self.key is None:
+            return
+        with self.lock:
+            for entry in entries:
+                if pending:
+                    self.pending_keys[self.key(entry)] = threading.Event()
+                else:
+                    done = self.pending_keys.pop(self.key(entry), None)
+                    if done is not None:
+                        done.set()
+
+    def is_pending(self, key) -> bool:
+        """True kalau entry dengan key ini sudah di-submit tapi belum ditulis"""
+        with self.lock:
+            return key in self.pending_keys
+
+    def wait_for(self, key, timeout: float = 5.0) -> bool:
+        """Block sampai entry dengan key ini tertulis (window yang sedang jalan ditutup), maks. timeout detik.
+        Tidak menunggu entry lain, jadi tetap cepat walau queue terus terisi. False kalau timeout"""
+        with self.lock:
+            done = self.pending_keys.get(key)
+        if done is None:
+            return True
+        try:
+            self.queue.put_nowait(threading.Event())
+        except queue.Full:
+            pass
+        return done.wait(timeout)
+
+    def write(self, batch: List[Tuple[str, List[Dict], Dict]]):
+        if not batch:
+            return
+        try:
+            self.flush_batch(batch)
+        except Exception as e:
+            logger.exception("History flush failed, %d entries dropped: %s", len(batch), e)
+            with self.lock:
+                self.failed += len(batch)
+        else:
+            with self.lock:
+                self.written += len(batch)
+        self.track(batch, pending=False)
+
+    def flush(self):
+        """Block sampai semua entry yang sudah di-submit sebelum call ini tertulis (batch window yang sedang
+        jalan ditutup); entry yang masuk setelahnya tidak ditunggu"""
+        marker = threading.Event()
+        with self.state_lock:
+            if self.closed:
+                return
+            self.queue.put(marker)
+        marker.wait()
+
+    def close(self):
+        """Drain sisa queue lalu stop worker thread; submit() setelah ini menulis sinkron"""
+        with self.state_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(self.STOP)
+        self.thread.join()
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self.queue.qsize(),
+            'max_queue_size': self.queue.maxsize,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'written': self.written,
+            'failed': self.failed,
+            'sync_writes': self.sync_writes
+        }
+
+
+class TimeContext:
+    """Context waktu hasil parsing (time of day, flexibility, urgency, preferred ranges)"""
+
+    __slots__ = ('time_of_day', 'flexibility', 'urgency', 'preferred_times')
+
+    def __init__(self, time_of_day: Optional[str] = None, flexibility: bool = False,
+                 urgency: str = 'normal', preferred_times: Optional[List[Dict]] = None):
+        self.time_of_day = time_of_day          # morning, afternoon, evening, night
+        self.flexibility = flexibility          # apakah waktu flexible
+        self.urgency = urgency                  # high, normal, low
+        self.preferred_times = preferred_times or []  # range 'jam X-Y' yang disebut
+
+    def to_dict(self) -> Dict:
+        return {
+            'time_of_day': self.time_of_day,
+            'flexibility': self.flexibility,
+            'urgency': self.urgency,
+            'preferred_times': self.preferred_times
+        }
+
+    def __repr__(self):
+        return f"TimeContext({self.to_dict()})"
+
+
+class Activity:
+    """Satu activity hasil parsing (sebelum dijadwalkan)"""
+
+    __slots__ = ('name', 'hours', 'sessions', 'priority', 'type', 'target_day', 'flexible',
+                 'fixed_times', 'preferred_time', 'recurring', 'analysis', 'preferred_time_of_day',
+                 'highly_flexible', 'suggested_duration', 'recurring_instance', 'original_activity')
+
+    def __init__(self, name: str, hours: float, sessions: int, priority: str, type: str,
+                 target_day: int = 0, flexible: bool = True, fixed_times: Optional[List[str]] = None,
+                 preferred_time: Optional[str] = None):
+        self.name = name
+        self.hours = hours
+        self.sessions = sessions
+        self.priority = priority
+        self.type = type                  # templated / regular
+        self.target_day = target_day
+        self.flexible = flexible
+        self.fixed_times = fixed_times
+        self.preferred_time = preferred_time
+        self.recurring = None
+        self.analysis = None
+        self.preferred_time_of_day = None
+        self.highly_flexible = False
+        self.suggested_duration = None
+        self.recurring_instance = False
+        self.original_activity = None
+
+    def copy(self) -> 'Activity':
+        clone = Activity.__new__(Activity)
+        for field in self.__slots__:
+            setattr(clone, field, getattr(self, field))
+        return clone
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"Activity({self.name!r}, {self.hours}h x {self.sessions}, {self.priority})"
+
+
+class Event:
+    """Satu blok di integer-minute timeline. Equality = identity, jadi filter/remove O(1) per elemen"""
+
+    __slots__ = ('name', 'start_min', 'end_min', 'session', 'total_sessions', 'type', 'priority',
+                 'day_offset', 'hours', 'analysis', 'conflict_resolved')
+
+    def __init__(self, name: str, start_min: int, end_min: int, session, total_sessions, type: str,
+                 priority: str, day_offset: int, hours: float, analysis: Optional[Dict] = None):
+        self.name = name
+        self.start_min = start_min
+        self.end_min = end_min
+        self.session = session
+        self.total_sessions = total_sessions
+        self.type = type                  # fixed / flexible / break
+        self.priority = priority
+        self.day_offset = day_offset
+        self.hours = hours
+        self.analysis = analysis
+        self.conflict_resolved = False
+
+    def copy(self) -> 'Event':
+        clone = Event.__new__(Event)
+        for field in self.__slots__:
+            setattr(clone, field, getattr(self, field))
+        return clone
+
+    def __repr__(self):
+        return f"Event({self.name!r}, {self.start_min}-{self.end_min}, {self.type})"
+
+
+class Recurrence:
+    """RRULE-style recurrence (FREQ=DAILY/WEEKLY, INTERVAL, BYDAY) dengan occurrences yang di-generate lazy,
+    jadi horizon sepanjang apapun tidak perlu materialisasi semua tanggal"""
+
+    __slots__ = ('freq', 'dtstart', 'interval', 'byweekday')
+
+    WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    RRULE_DAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+    def __init__(self, freq: str, dtstart: date, interval: int = 1, byweekday: Optional[set] = None):
+        self.freq = freq                  # daily / weekly
+        self.dtstart = dtstart
+        self.interval = interval
+        self.byweekday = byweekday or ({dtstart.weekday()} if freq == 'weekly' else None)
+
+    @classmethod
+    def from_pattern(cls, pattern: Dict, dtstart: date) -> Optional['Recurrence']:
+        """recurring_pattern dari parser -> Recurrence"""
+        if pattern['type'] == 'daily':
+            return cls('daily', dtstart)
+        if pattern['type'] == 'weekly':
+            return cls('weekly', dtstart, byweekday={cls.WEEKDAYS.index(day) for day in pattern.get('days', [])})
+        return None
+
+    def matches(self, day: date) -> bool:
+        offset = (day - self.dtstart).days
+        if offset < 0:
+            return False
+        if self.freq == 'daily':
+            return offset % self.interval == 0
+        # Weekly: minggu ke-n dihitung dari senin minggu dtstart
+        week = (offset + self.dtstart.weekday()) // 7
+        return day.weekday() in self.byweekday and week % self.interval == 0
+
+    def occurrences(self, start: date, end: date) -> Iterator[date]:
+        """Tanggal yang cocok di [start, end), satu per satu"""
+        day = max(start, self.dtstart)
+        one_day = timedelta(days=1)
+        while day < end:
+            if self.matches(day):
+                yield day
+            day += one_day
+
+    def to_rrule(self) -> str:
+        rule = f"FREQ={self.freq.upper()};INTERVAL={self.interval}"
+        if self.freq == 'weekly':
+            rule += ";BYDAY=" + ",".join(self.RRULE_DAYS[day] for day in sorted(self.byweekday))
+        return rule
+
+    def __repr__(self):
+        return f"Recurrence({self.to_rrule()}, dtstart={self.dtstart.isoformat()})"
+
+
+class TimelineOccupancy:
+    """Sorted free-list di integer-minute timeline: busy intervals di-merge, cari gap pakai bisect"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def occupy(self, start: int, end: int):
+        """Tandai [start, end) sebagai busy (merge dengan interval yang bersinggungan)"""
+        if end <= start:
+            return
+        first = bisect_left(self.ends, start)
+        last = bisect_right(self.starts, end)
+        if first < last:
+            start = min(start, self.starts[first])
+            end = max(end, self.ends[last - 1])
+        self.starts[first:last] = [start]
+        self.ends[first:last] = [end]
+
+    def is_free(self, start: int, end: int) -> bool:
+        index = bisect_right(self.ends, start)
+        return index == len(self.starts) or self.starts[index] >= end
+
+    def first_fit(self, earliest: int, duration: int) -> int:
+        """Start pertama >= earliest dengan gap kosong sepanjang `duration` menit"""
+        candidate = earliest
+        index = bisect_right(self.ends, candidate)
+        while index < len(self.starts) and candidate + duration > self.starts[index]:
+            candidate = max(candidate, self.ends[index])
+            index += 1
+        return candidate
+
+
+class CoverageTree:
+    """Segment tree per menit untuk satu hari: coverage count (range add, release = add -1) + panjang run kosong
+    prefix / suffix / terpanjang di posisi dengan count minimum subtree. Menit di luar hari selalu terisi,
+    jadi run tidak pernah lewat tengah malam. first_fit, run_end dan add masing-masing O(log menit)"""
+
+    SIZE = 2048  # leaves >= MINUTES_PER_DAY
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]]):
+        size = self.SIZE
+        counts = [0] * (size + 1)
+        for start, end in chain(intervals, [(MINUTES_PER_DAY, size)]):
+            counts[start] += 1
+            counts[end] -= 1
+        self.mn = [0] * (2 * size)
+        self.add_tag = [0] * (2 * size)
+        self.pre = [1] * (2 * size)
+        self.suf = [1] * (2 * size)
+        self.best = [1] * (2 * size)
+        covered = 0
+        for minute in range(size):
+            covered += counts[minute]
+            self.mn[size + minute] = covered
+        for node in range(size - 1, 0, -1):
+            self.pull(node, size >> node.bit_length())
+
+    def pull(self, node: int, half: int):
+        left, right = 2 * node, 2 * node + 1
+        low = min(self.mn[left], self.mn[right])
+        lp, ls, lb = (self.pre[left], self.suf[left], self.best[left]) if self.mn[left] == low else (0, 0, 0)
+        rp, rs, rb = (self.pre[right], self.suf[right], self.best[right]) if self.mn[right] == low else (0, 0, 0)
+        self.pre[node] = lp if lp < half else half + rp
+        self.suf[node] = rs if rs < half else half + ls
+        self.best[node] = max(lb, rb, ls + rp)
+        self.mn[node] = low + self.add_tag[node]
+
+    def free(self, node: int, acc: int) -> Tuple[int, int, int]:
+        """(prefix, suffix, terpanjang) run kosong; acc = jumlah add tag ancestors"""
+        if self.mn[node] + acc:
+            return 0, 0, 0
+        return self.pre[node], self.suf[node], self.best[node]
+
+    def add(self, lo: int, hi: int, delta: int, node: int = 1, node_lo: int = 0, node_hi: int = SIZE):
+        if hi <= node_lo or node_hi <= lo:
+            return
+        if lo <= node_lo and node_hi <= hi:
+            self.add_tag[node] += delta
+            self.mn[node] += delta
+            return
+        mid = (node_lo + node_hi) // 2
+        self.add(lo, hi, delta, 2 * node, node_lo, mid)
+        self.add(lo, hi, delta, 2 * node + 1, mid, node_hi)
+        self.pull(node, mid - node_lo)
+
+    def first_fit(self, lo: int, duration: int) -> Optional[int]:
+        """Menit pertama >= lo dengan `duration` menit kosong berturut-turut (selalu awal sebuah gap)"""
+        carry = 0  # panjang run kosong yang bersambung ke node berikutnya
+
+        def search(node: int, node_lo: int, node_hi: int, acc: int) -> Optional[int]:
+            nonlocal carry
+            if node_hi <= lo:
+                return None
+            if lo <= node_lo:
+                pre, suf, best = self.free(node, acc)
+                if carry + pre >= duration:
+                    return node_lo - carry
+                if best < duration:
+                    carry = carry + pre if pre == node_hi - node_lo else suf
+                    return None
+            mid = (node_lo + node_hi) // 2
+            acc += self.add_tag[node]
+            found = search(2 * node, node_lo, mid, acc)
+            return found if found is not None else search(2 * node + 1, mid, node_hi, acc)
+
+        return search(1, 0, self.SIZE, 0)
+
+    def run_end(self, position: int) -> int:
+        """Akhir run kosong yang mulai di `position` (menit terisi pertama setelahnya)"""
+        def search(node: int, node_lo: int, node_hi: int, acc: int) -> Optional[int]:
+            if node_hi <= position:
+                return None
+            if position <= node_lo:
+                pre = self.free(node, acc)[0]
+                return None if pre == node_hi - node_lo else node_lo + pre
+            mid = (node_lo + node_hi) // 2
+            acc += self.add_tag[node]
+            found = search(2 * node, node_lo, mid, acc)
+            return found if found is not None else search(2 * node + 1, mid, node_hi, acc)
+
+        return search(1, 0, self.SIZE, 0)
+
+
+class GapIndex:
+    """Free gaps per hari di dalam PLACEMENT_HOURS (06:00 dan 24:00 jadi batas, jadi waktu kosong sebelum event
+    pertama dan setelah event terakhir ikut dihitung). Tiap hari satu CoverageTree, dibangun saat hari itu pertama
+    dipakai: first-fit, occupy (slot baru) dan release (slot lama di-merge kembali dengan gap tetangganya)
+    masing-masing O(log menit per hari), tidak tergantung jumlah event"""
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        self.pending = {}
+        self.trees = {}
+        for start, end in intervals:
+            for day, lo, hi in self.day_pieces(start, end):
+                self.pending.setdefault(day, []).append((lo, hi))
+
+    @staticmethod
+    def day_pieces(start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        """(day, start, end) per hari yang disentuh [start, end), dalam menit sejak awal hari"""
+        for day in range(start // MINUTES_PER_DAY, max(start, end - 1) // MINUTES_PER_DAY + 1):
+            day_start = day * MINUTES_PER_DAY
+            lo, hi = max(start, day_start) - day_start, min(end, day_start + MINUTES_PER_DAY) - day_start
+            if lo < hi:
+                yield day, lo, hi
+
+    def tree(self, day: int) -> CoverageTree:
+        if day not in self.trees:
+            self.trees[day] = CoverageTree(chain([(0, PLACEMENT_HOURS[0])], self.pending.pop(day, [])))
+        return self.trees[day]
+
+    def fits(self, day: int, duration: int) -> Iterator[Tuple[int, int]]:
+        """Gaps di `day` (pagi dulu) yang panjangnya >= duration, sebagai (start, end) absolut"""
+        tree = self.tree(day)
+        day_start = day * MINUTES_PER_DAY
+        position = 0
+        while True:
+            start = tree.first_fit(position, duration)
+            if start is None:
+                return
+            position = tree.run_end(start)
+            yield day_start + start, day_start + position
+
+    def occupy(self, start: int, end: int):
+        for day, lo, hi in self.day_pieces(start, end):
+            self.tree(day).add(lo, hi, 1)
+
+    def release(self, start: int, end: int):
+        for day, lo, hi in self.day_pieces(start, end):
+            self.tree(day).add(lo, hi, -1)
+
+
+def to_minutes(hours: float) -> int:
+    """Durasi jam -> menit (integer timeline)"""
+    return int(round(hours * 60))
+
+
+def clock_minutes(time_str: str) -> int:
+    """'HH:MM' -> menit sejak tengah malam"""
+    hour, minute = time_str.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def fixed_day_events(activities: List[Activity], day_offset: int) -> Dict[int, Event]:
+    """Events untuk activities dengan fixed_times (start minute -> Event, start yang sama ditimpa)"""
+    day_start = day_offset * MINUTES_PER_DAY
+    daily_schedule = {}
+    
+    for activity in activities:
+        if not activity.fixed_times:
+            continue
+        for time_str in activity.fixed_times:
+            event_start = day_start + clock_minutes(time_str)
+            
+            event = Event(
+                name=activity.name,
+                start_min=event_start,
+                end_min=event_start + to_minutes(activity.hours),
+                session=1,
+                total_sessions=1,
+                type='fixed',
+                priority=activity.priority,
+                day_offset=day_offset,
+                hours=activity.hours,
+                analysis=activity.analysis
+            )
+            
+            daily_schedule[event_start] = event
+    
+    return daily_schedule
+
+
+def schedule_day(activities: List[Activity], day_offset: int) -> List[Event]:
+    """Generate schedule untuk single day dengan priority (pure function, aman untuk process pool)"""
+    schedule = []
+    day_start = day_offset * MINUTES_PER_DAY
+    
+    # Process fixed activities first
+    daily_schedule = fixed_day_events(activities, day_offset)
+    flexible_activities = [a for a in activities if not a.fixed_times]
+    
+    # Occupancy index untuk fixed blocks, flexible events ikut ditandai saat ditempatkan
+    occupancy = TimelineOccupancy()
+    for fixed_event in daily_schedule.values():
+        occupancy.occupy(fixed_event.start_min, fixed_event.end_min)
+    
+    # Process flexible activities by priority
+    current_time = day_start + clock_minutes("09:00")
+    
+    for activity in flexible_activities:
+        duration = to_minutes(activity.hours)
+        
+        for session in range(activity.sessions):
+            # First free gap yang cukup untuk sesi ini
+            current_time = occupancy.first_fit(current_time, duration)
+            end_time = current_time + duration
+            occupancy.occupy(current_time, end_time)
+            
+            event = Event(
+                name=activity.name,
+                start_min=current_time,
+                end_min=end_time,
+                session=session + 1,
+                total_sessions=activity.sessions,
+                type='flexible',
+                priority=activity.priority,
+                day_offset=day_offset,
+                hours=activity.hours,
+                analysis=activity.analysis
+            )
+            
+            schedule.append(event)
+            current_time = end_time
+            
+            # Break between sessions (kalau slot setelah sesi masih kosong)
+            if session < activity.sessions - 1:
+                break_time = end_time + 15
+                if occupancy.is_free(end_time, break_time):
+                    occupancy.occupy(end_time, break_time)
+                    schedule.append(Event(
+                        name="BREAK",
+                        start_min=end_time,
+                        end_min=break_time,
+                        session='-',
+                        total_sessions='-',
+                        type='break',
+                        priority='low',
+                        day_offset=day_offset,
+                        hours=0.25
+                    ))
+                current_time = break_time
+    
+    # Combine schedules
+    day_final = list(daily_schedule.values()) + schedule
+    day_final.sort(key=lambda x: x.start_min)
+    
+    return day_final
+
+
+def schedule_days(day_plans: List[Tuple[int, List[Activity]]],
+                  placement: Optional[PlacementOptions] = None) -> Tuple[List[Event], bool]:
+    """Process pool task: plan_day untuk satu chunk hari (activities sudah urut by priority).
+    Return (events, apakah ada search yang berhenti di deadline)"""
+    events = []
+    report = {'timed_out': False}
+    for day_offset, activities in day_plans:
+        events.extend(plan_day(activities, day_offset, placement, report))
+    return events, report['timed_out']
+
+
+def plan_day(activities: List[Activity], day_offset: int, placement: Optional[PlacementOptions] = None,
+             report: Optional[Dict] = None) -> List[Event]:
+    """Greedy packer, atau optimal placement engine kalau placement options diberikan"""
+    if placement is None:
+        return schedule_day(activities, day_offset)
+    return optimize_day(activities, day_offset, placement.windows, monotonic() + placement.day_budget, report)
+
+
+# Jam-jam untuk time of day (preferred_time_of_day & analysis time_preferences)
+TIME_OF_DAY_WINDOWS = {
+    'morning': (6 * 60, 12 * 60),
+    'afternoon': (12 * 60, 15 * 60),
+    'evening': (15 * 60, 18 * 60),
+    'night': (18 * 60, 22 * 60)
+}
+
+PLACEMENT_STEP = 15                          # granularity kandidat start (menit)
+PLACEMENT_MAX_SESSIONS = 200                 # search rekursif satu level per session; lebih dari ini pakai incumbent
+PLACEMENT_HOURS = (6 * 60, MINUTES_PER_DAY)  # flexible sessions ditempatkan dalam jam ini
+SESSION_BREAK = 15
+
+
+def placement_preference(activity: Activity, start: int, duration: int, windows: List[Tuple[int, int]]) -> float:
+    """Skor preferensi untuk start (menit dalam hari): jumlah semua preferensi yang terpenuhi"""
+    score = 0.0
+    if activity.preferred_time:
+        score += max(0, 1 - abs(start - clock_minutes(activity.preferred_time)) / 240)
+    if any(window_start <= start and start + duration <= window_end for window_start, window_end in windows):
+        score += 1
+    
+    window = TIME_OF_DAY_WINDOWS.get(activity.preferred_time_of_day)
+    if window and window[0] <= start < window[1]:
+        score += 0.8
+    
+    time_preferences = (activity.analysis or {}).get('time_preferences', [])
+    for rank, time_of_day in enumerate(time_preferences[:2]):
+        window = TIME_OF_DAY_WINDOWS.get(time_of_day)
+        if window and window[0] <= start < window[1]:
+            score += 0.6 - 0.2 * rank
+    return score
+
+
+def optimize_day(activities: List[Activity], day_offset: int, windows: List[Tuple[int, int]] = (),
+                 deadline: Optional[float] = None, report: Optional[Dict] = None) -> List[Event]:
+    """Branch-and-bound atas start time tiap flexible session: maximize sum(priority weight * (1 + preference)).
+    Fixed events tetap; session yang tidak dapat slot di PLACEMENT_HOURS bernilai 0 dan di-first-fit setelahnya.
+    Incumbent awal = placement greedy packer, jadi search bisa berhenti di deadline (monotonic) kapan saja
+    dan memakai placement terbaik yang sudah ditemukan; report['timed_out'] di-set kalau itu terjadi.
+    Hari dengan lebih dari PLACEMENT_MAX_SESSIONS session tidak di-search (recursion depth), langsung incumbent"""
+    day_start = day_offset * MINUTES_PER_DAY
+    daily_schedule = fixed_day_events(activities, day_offset)
+    
+    fixed = TimelineOccupancy()
+    for fixed_event in daily_schedule.values():
+        fixed.occupy(fixed_event.start_min, fixed_event.end_min)
+    
+    # Satu entry per session: (activity, index, duration, reserved menit termasuk break)
+    anchor = clock_minutes("09:00")
+    sessions = []
+    for activity in activities:
+        if activity.fixed_times:
+            continue
+        duration = to_minutes(activity.hours)
+        for index in range(activity.sessions):
+            reserved = duration + (SESSION_BREAK if index < activity.sessions - 1 else 0)
+            sessions.append((activity, index, duration, reserved))
+    
+    # Incumbent: first-fit mulai 09:00 seperti greedy packer, dinilai dengan objective yang sama.
+    # Murah (tanpa kandidat), jadi selalu ada placement valid walau deadline sudah lewat
+    seed = TimelineOccupancy()
+    for fixed_event in daily_schedule.values():
+        seed.occupy(fixed_event.start_min, fixed_event.end_min)
+    seed_starts, seed_value = [], 0.0
+    current = day_start + anchor
+    for activity, index, duration, reserved in sessions:
+        start = seed.first_fit(current, reserved)
+        if start + reserved > day_start + PLACEMENT_HOURS[1]:
+            seed_starts.append(None)
+            continue
+        seed.occupy(start, start + reserved)
+        seed_starts.append(start)
+        seed_value += PRIORITY_WEIGHTS.get(activity.priority, 1) * \
+            (1 + placement_preference(activity, start - day_start, duration, windows))
+        current = start + reserved
+    
+    # Kandidat start per activity urut by value (nilai sama -> paling dekat 09:00), di-share antar session
+    # dan antar activity dengan preferensi yang sama; deadline dicek per activity
+    candidate_lists = {}
+    session_candidates = []
+    searchable = len(sessions) <= PLACEMENT_MAX_SESSIONS
+    for activity, index, duration, reserved in (sessions if searchable else ()):
+        if deadline is not None and monotonic() > deadline:
+            break
+        signature = (duration, activity.priority, activity.preferred_time, activity.preferred_time_of_day,
+                     tuple((activity.analysis or {}).get('time_preferences', [])))
+        if signature not in candidate_lists:
+            weight = PRIORITY_WEIGHTS.get(activity.priority, 1)
+            candidates = []
+            for start in range(PLACEMENT_HOURS[0], PLACEMENT_HOURS[1] - duration + 1, PLACEMENT_STEP):
+                value = weight * (1 + placement_preference(activity, start, duration, windows))
+                candidates.append((-value, abs(start - anchor), start))
+            candidates.sort()
+            candidate_lists[signature] = [(-value, start + day_start) for value, _, start in candidates]
+        session_candidates.append(candidate_lists[signature])
+    
+    # Upper bound: nilai terbaik tiap session tanpa memperhitungkan occupancy
+    bounds = [0.0] * (len(sessions) + 1)
+    for position in range(len(session_candidates) - 1, -1, -1):
+        candidates = session_candidates[position]
+        bounds[position] = bounds[position + 1] + (candidates[0][0] if candidates else 0)
+    
+    placed_starts, placed_ends = [], []
+    chosen = [None] * len(sessions)
+    best = {'value': seed_value, 'starts': seed_starts}
+    
+    def is_free(start: int, end: int) -> bool:
+        if not fixed.is_free(start, end):
+            return False
+        index = bisect_right(placed_starts, start)
+        if index > 0 and placed_ends[index - 1] > start:
+            return False
+        return index == len(placed_starts) or placed_starts[index] >= end
+    
+    def search(position: int, value: float) -> bool:
+        """False = deadline lewat, hentikan seluruh search"""
+        if deadline is not None and monotonic() > deadline:
+            return False
+        if value + bounds[position] <= best['value']:
+            return True
+        if position == len(sessions):
+            best['value'] = value
+            best['starts'] = list(chosen)
+            return True
+        
+        activity, index, duration, reserved = sessions[position]
+        candidates = session_candidates[position]
+        earliest = 0
+        if index > 0 and chosen[position - 1] is not None:
+            earliest = chosen[position - 1] + duration + SESSION_BREAK
+        
+        for candidate_value, start in candidates:
+            if start < earliest or not is_free(start, start + reserved):
+                continue
+            slot = bisect_left(placed_starts, start)
+            placed_starts.insert(slot, start)
+            placed_ends.insert(slot, start + reserved)
+            chosen[position] = start
+            completed = search(position + 1, value + candidate_value)
+            del placed_starts[slot], placed_ends[slot]
+            chosen[position] = None
+            if not completed:
+                return False
+        
+        # Session tanpa slot (nilai 0)
+        return search(position + 1, value)
+    
+    completed = not searchable or (len(session_candidates) == len(sessions) and search(0, 0.0))
+    if not completed and report is not None:
+        report['timed_out'] = True
+    
+    # Build events; session tanpa slot di-first-fit mulai 09:00 seperti greedy packer
+    occupancy = fixed
+    starts = best['starts']
+    for start, (_, _, _, reserved) in zip(starts, sessions):
+        if start is not None:
+            occupancy.occupy(start, start + reserved)
+    
+    schedule = []
+    for start, (activity, index, duration, reserved) in zip(starts, sessions):
+        if start is None:
+            start = occupancy.first_fit(day_start + anchor, reserved)
+            occupancy.occupy(start, start + reserved)
+        schedule.append(Event(
+            name=activity.name,
+            start_min=start,
+            end_min=start + duration,
+            session=index + 1,
+            total_sessions=activity.sessions,
+            type='flexible',
+            priority=activity.priority,
+            day_offset=day_offset,
+            hours=activity.hours,
+            analysis=activity.analysis
+        ))
+        if reserved > duration:
+            schedule.append(Event(
+                name="BREAK",
+                start_min=start + duration,
+                end_min=start + reserved,
+                session='-',
+                total_sessions='-',
+                type='break',
+                priority='low',
+                day_offset=day_offset,
+                hours=0.25
+            ))
+    
+    day_final = list(daily_schedule.values()) + schedule
+    day_final.sort(key=lambda x: x.start_min)
+    
+    # Session yang di-first-fit bisa jatuh sebelum session lain dari activity yang sama: nomori ulang kronologis
+    session_counts = {}
+    for event in day_final:
+        if event.type == 'flexible':
+            event.session = session_counts[event.name] = session_counts.get(event.name, 0) + 1
+    return day_final
+
+
+class UltimateScheduler:
+    def __init__(self, parse_cache_size: int = 0, headless: bool = False, history_queue_size: int = 0,
+                 history_batch_size: int = 100, history_flush_interval: float = 0.5, analytics_cache_ttl: float = 0,
+                 result_cache_size: int = 0, result_cache_max_bytes: int = 64 * 1024 * 1024,
+                 clock: Optional[Callable[[], datetime]] = None, tz: Optional[str] = None,
+                 day_workers: int = 0, parallel_day_threshold: int = 90, placement_budget_ms: int = 0,
+                 db_path: Union[str, Path] = "scheduler_history.db"):
         self.activity_templates = {
             'sholat': {'duration': 1, 'priority': 'high', 'fixed_times': ['05:00', '12:30', '15:30', '18:00', '19:30']},
             'makan': {'duration': 1, 'priority': 'high', 'fixed_times': ['08:00', '12:00', '19:00']},
@@ -37,75 +1160,183 @@ class UltimateScheduler:
             'minggu depan': 7
         }
         
+        self.weekday_keywords = {
+            'senin': 'monday', 'selasa': 'tuesday', 'rabu': 'wednesday',
+            'kamis': 'thursday', 'jumat': 'friday', 'sabtu': 'saturday', 'minggu': 'sunday'
+        }
+        
         self.recurring_keywords = {
             'setiap': 'every',
             'setiap hari': 'daily',
             'setiap minggu': 'weekly', 
             'setiap bulan': 'monthly',
-            'senin': 'monday', 'selasa': 'tuesday', 'rabu': 'wednesday',
-            'kamis': 'thursday', 'jumat': 'friday', 'sabtu': 'saturday', 'minggu': 'sunday'
+            **self.weekday_keywords
+        }
+        
+        self.time_of_day_keywords = {
+            'pagi': 'morning', 'siang': 'afternoon', 
+            'sore': 'evening', 'malam': 'night'
+        }
+        
+        self.flexibility_indicators = [
+            'bisa kapan saja', 'flexible', 'waktu bebas', 
+            'terserah', 'kapan aja', 'bisa disesuaikan'
+        ]
+        
+        self.urgency_keywords = {
+            'high': ['urgent', 'penting', 'segera', 'harus'],
+            'low': ['santai', 'bisa nanti', 'longgar']
         }
         
-        self.priority_weights = {
-            'high': 3,
-            'medium': 2, 
-            'low': 1
+        self.filler_words = ['hari', 'ini', 'saya', 'mau', 'aku', 'ingin', 'yang', 'dan', 'dengan', 'akan']
+        
+        self.priority_weights = dict(PRIORITY_WEIGHTS)
+        
+        self.activity_categories = {
+            'learning': ['belajar', 'studi', 'research', 'baca', 'tugas'],
+            'work': ['kerja', 'meeting', 'rapat', 'presentasi', 'project'],
+            'physical': ['olahraga', 'workout', 'gym', 'lari', 'fitness'],
+            'creative': ['desain', 'nulis', 'coding', 'develop', 'buat'],
+            'maintenance': ['makan', 'istirahat', 'break', 'sholat', 'mandi']
         }
         
-        # Setup database untuk history
+        self.cognitive_load_keywords = {
+            'high': ['belajar', 'analisis', 'coding', 'strategi'],
+            'medium': ['meeting', 'rapat', 'diskusi']
+        }
+        
+        self.energy_keywords = {
+            'high': ['olahraga', 'workout', 'lari', 'fitness'],
+            'medium': ['meeting', 'belajar', 'kerja']
+        }
+        
+        self.social_keywords = {
+            'high': ['meeting', 'rapat', 'diskusi', 'team'],
+            'medium': ['belajar kelompok', 'collab']
+        }
+        
+        self.priority_keywords = {
+            'high': ['belajar', 'kerja', 'meeting', 'project', 'ai', 'coding'],
+            'low': ['main', 'hiburan', 'social', 'game', 'nonton']
+        }
+        
+        self.name_noise_words = {'pagi', 'siang', 'sore', 'malam', 'besok', 'lusa', 'urgent', 'penting', 'flexible', 'waktu'}
+        
+        # Satu automaton untuk semua lexicon, dibangun sekali di startup
+        self.keyword_automaton = KeywordAutomaton()
+        self.lexicon_order = {}
+        word_lexicons = {
+            'day': self.day_keywords,
+            'recurring': self.recurring_keywords,
+            'time_of_day': self.time_of_day_keywords,
+            'flexibility': self.flexibility_indicators,
+            'urgency_high': self.urgency_keywords['high'],
+            'urgency_low': self.urgency_keywords['low'],
+            'filler': self.filler_words,
+            'separator': ['serta']
+        }
+        for lexicon, entries in word_lexicons.items():
+            for phrase in entries:
+                self.keyword_automaton.add(phrase, lexicon, phrase)
+        
+        labelled_lexicons = {
+            'category': self.activity_categories,
+            'cognitive_load': self.cognitive_load_keywords,
+            'energy': self.energy_keywords,
+            'social': self.social_keywords,
+            'priority': self.priority_keywords,
+            'template': {name: [name] for name in self.activity_templates}
+        }
+        for lexicon, labels in labelled_lexicons.items():
+            self.lexicon_order[lexicon] = {label: rank for rank, label in enumerate(labels)}
+            for label, keywords in labels.items():
+                for keyword in keywords:
+                    self.keyword_automaton.add(keyword, lexicon, label)
+        
+        self.keyword_automaton.build()
+        self.lexer = SentenceLexer(self.keyword_automaton, set(word_lexicons))
+        
+        # Opt-in cache untuk parsed sentences (0 = disabled)
+        self.parse_cache = ParseCache(parse_cache_size) if parse_cache_size > 0 else None
+        
+        # Headless: skip semua console rendering (default untuk API), diagnostics lewat logger
+        self.headless = headless
+        
+        # Sumber "sekarang" untuk engine (inject untuk test / replay yang deterministik).
+        # Naive datetime dari clock = local time; tz menentukan "hari ini" (None = local time server)
+        self.clock = clock or datetime.now
+        self.tz = ZoneInfo(tz) if tz else None
+        
+        # Opt-in cache hasil pipeline lengkap per (sentence, reference date, options) (0 = disabled)
+        self.result_cache = ResultCache(result_cache_size, result_cache_max_bytes) if result_cache_size > 0 else None
+        
+        # Opt-in process pool untuk plan multi-hari panjang (0 = selalu serial di process ini)
+        self.day_workers = day_workers
+        self.parallel_day_threshold = parallel_day_threshold
+        self.day_pool = None
+        self.day_pool_lock = threading.Lock()
+        
+        # Opt-in optimal placement engine dengan time budget per request (0 = greedy packer)
+        self.placement_budget_ms = placement_budget_ms
+        
+        # Opt-in TTL cache untuk get_analytics (0 = disabled)
+        self.analytics_cache = AnalyticsCache(analytics_cache_ttl) if analytics_cache_ttl > 0 else None
+        
+        # Setup database untuk history (satu connection per worker thread)
+        self.db_path = Path(db_path)
+        self.db_local = threading.local()
+        self.db_connections: List[sqlite3.Connection] = []
+        self.db_lock = threading.Lock()
         self.setup_database()
+        
+        # Opt-in write-behind untuk history (0 = tulis sinkron di request thread)
+        self.history_writer = None
+        if history_queue_size > 0:
+            self.history_writer = HistoryWriter(self.save_schedule_history_batch, history_queue_size,
+                                                history_batch_size, history_flush_interval,
+                                                key=lambda entry: entry[4])
     
-    def enhanced_time_context(self, sentence: str) -> Dict:
+    def enhanced_time_context(self, sentence: str, stream: Optional[TokenStream] = None) -> TimeContext:
         """Deteksi context waktu yang lebih sophisticated"""
-        sentence_lower = sentence.lower()
-        time_context = {
-            'time_of_day': None,  # pagi, siang, sore, malam
-            'flexibility': False,  # apakah waktu flexible
-            'urgency': 'normal',   # urgent, normal, relaxed
-            'preferred_times': []  # waktu preferred yang disebut
-        }
+        stream = stream or self.lexer.scan(sentence)
+        time_context = TimeContext()
         
         # Time of day detection
-        time_keywords = {
-            'pagi': 'morning', 'siang': 'afternoon', 
-            'sore': 'evening', 'malam': 'night'
-        }
-        
-        for id_word, en_word in time_keywords.items():
-            if id_word in sentence_lower:
-                time_context['time_of_day'] = en_word
+        found_times = stream.found('time_of_day')
+        for id_word, en_word in self.time_of_day_keywords.items():
+            if id_word in found_times:
+                time_context.time_of_day = en_word
                 break
         
         # Flexibility detection
-        flexibility_indicators = [
-            'bisa kapan saja', 'flexible', 'waktu bebas', 
-            'terserah', 'kapan aja', 'bisa disesuaikan'
-        ]
-        
-        for indicator in flexibility_indicators:
-            if indicator in sentence_lower:
-                time_context['flexibility'] = True
-                break
+        if stream.found('flexibility'):
+            time_context.flexibility = True
         
         # Urgency detection
-        if any(word in sentence_lower for word in ['urgent', 'penting', 'segera', 'harus']):
-            time_context['urgency'] = 'high'
-        elif any(word in sentence_lower for word in ['santai', 'bisa nanti', 'longgar']):
-            time_context['urgency'] = 'low'
+        if stream.found('urgency_high'):
+            time_context.urgency = 'high'
+        elif stream.found('urgency_low'):
+            time_context.urgency = 'low'
         
         # Preferred time ranges
-        time_ranges = re.findall(r'(jam\s+(\d+)[\s\-](\d+))', sentence_lower)
-        for match in time_ranges:
-            time_context['preferred_times'].append({
-                'start': int(match[1]),
-                'end': int(match[2])
-            })
+        time_context.preferred_times = stream.time_ranges()
         
         return time_context
 
+    def keyword_hits(self, text: str) -> Dict[str, set]:
+        """Satu scan automaton untuk semua classifier"""
+        return self.keyword_automaton.hits(text.lower())
+    
+    def first_hit(self, hits: Dict[str, set], lexicon: str) -> Optional[str]:
+        """Label hit dengan urutan paling awal di lexicon (sama dengan loop dict sebelumnya)"""
+        labels = hits.get(lexicon)
+        if not labels:
+            return None
+        return min(labels, key=self.lexicon_order[lexicon].__getitem__)
+
     def advanced_activity_analysis(self, activity_name: str) -> Dict:
         """Deep analysis untuk memahami karakteristik activity"""
-        activity_lower = activity_name.lower()
+        hits = self.keyword_hits(activity_name)
         
         analysis = {
             'category': 'general',
@@ -117,40 +1348,16 @@ class UltimateScheduler:
         }
         
         # Category detection
-        categories = {
-            'learning': ['belajar', 'studi', 'research', 'baca', 'tugas'],
-            'work': ['kerja', 'meeting', 'rapat', 'presentasi', 'project'],
-            'physical': ['olahraga', 'workout', 'gym', 'lari', 'fitness'],
-            'creative': ['desain', 'nulis', 'coding', 'develop', 'buat'],
-            'maintenance': ['makan', 'istirahat', 'break', 'sholat', 'mandi']
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in activity_lower for keyword in keywords):
-                analysis['category'] = category
-                break
+        analysis['category'] = self.first_hit(hits, 'category') or 'general'
         
         # Cognitive load analysis
-        if any(word in activity_lower for word in ['belajar', 'analisis', 'coding', 'strategi']):
-            analysis['cognitive_load'] = 'high'
-        elif any(word in activity_lower for word in ['meeting', 'rapat', 'diskusi']):
-            analysis['cognitive_load'] = 'medium'
-        else:
-            analysis['cognitive_load'] = 'low'
+        analysis['cognitive_load'] = self.first_hit(hits, 'cognitive_load') or 'low'
         
         # Energy requirements
-        if any(word in activity_lower for word in ['olahraga', 'workout', 'lari', 'fitness']):
-            analysis['energy_required'] = 'high'
-        elif any(word in activity_lower for word in ['meeting', 'belajar', 'kerja']):
-            analysis['energy_required'] = 'medium'
-        else:
-            analysis['energy_required'] = 'low'
+        analysis['energy_required'] = self.first_hit(hits, 'energy') or 'low'
         
         # Social interaction
-        if any(word in activity_lower for word in ['meeting', 'rapat', 'diskusi', 'team']):
-            analysis['social_interaction'] = 'high'
-        elif any(word in activity_lower for word in ['belajar kelompok', 'collab']):
-            analysis['social_interaction'] = 'medium'
+        analysis['social_interaction'] = self.first_hit(hits, 'social') or 'none'
         
         # Optimal duration based on category
         optimal_durations = {
@@ -174,51 +1381,90 @@ class UltimateScheduler:
         
         return analysis
     
-    def clean_activity_name(self, activity_name: str, time_context: Dict) -> str:
+    def clean_activity_name(self, activity_name: str, time_context: TimeContext) -> str:
         """Remove time keywords dari activity name"""
-        time_keywords = ['pagi', 'siang', 'sore', 'malam', 'besok', 'lusa', 'urgent', 'penting', 'flexible', 'waktu']
-        
         words = activity_name.split()
-        cleaned_words = [word for word in words if word.lower() not in time_keywords]
+        cleaned_words = [word for word in words if word.lower() not in self.name_noise_words]
         
         return ' '.join(cleaned_words) if cleaned_words else activity_name
 
-    def context_aware_parse(self, sentence: str) -> Tuple[List[Dict], int, Dict, Dict]:
+    def context_aware_parse(self, sentence: str) -> Tuple[List[Activity], int, Dict, TimeContext]:
         """Enhanced parsing dengan context understanding"""
-        print(f"🧠 Context-Aware Parsing: '{sentence}'")
+        key = self.normalize_sentence(sentence)
+        if self.parse_cache is not None:
+            cached = self.parse_cache.get(key)
+            if cached is not None:
+                logger.debug("Parse cache hit: %r", sentence)
+                return cached
+        
+        logger.debug("Context-aware parsing: %r", sentence)
+        
+        # Single pass lexer - hasilnya dipakai semua tahap di bawah
+        stream = self.lexer.scan(key)
         
         # Get time context
-        time_context = self.enhanced_time_context(sentence)
-        print(f"   ⏰ Time Context: {time_context}")
+        time_context = self.enhanced_time_context(sentence, stream)
+        logger.debug("Time context: %s", time_context)
         
         # Parse activities dengan context (gunakan existing advanced_parse)
-        activities, target_day, recurring_pattern = self.advanced_parse(sentence)
+        activities, target_day, recurring_pattern = self.advanced_parse(sentence, stream)
         
         # Enhance each activity dengan analysis - FIXED: PASTIKAN INI DI DALAM LOOP!
         for activity in activities:
-            activity_analysis = self.advanced_activity_analysis(activity['name'])
-            activity['analysis'] = activity_analysis
+            activity_analysis = self.advanced_activity_analysis(activity.name)
+            activity.analysis = activity_analysis
             
             # Apply context-based adjustments
-            if time_context['time_of_day']:
-                activity['preferred_time_of_day'] = time_context['time_of_day']
+            if time_context.time_of_day:
+                activity.preferred_time_of_day = time_context.time_of_day
             
-            if time_context['flexibility']:
-                activity['highly_flexible'] = True
+            if time_context.flexibility:
+                activity.highly_flexible = True
                 
             # Adjust duration based on optimal timing
             if activity_analysis['optimal_duration']:
                 suggested_duration = activity_analysis['optimal_duration']
-                if abs(activity['hours'] - suggested_duration) > 1.0:
-                    activity['suggested_duration'] = suggested_duration
+                if abs(activity.hours - suggested_duration) > 1.0:
+                    activity.suggested_duration = suggested_duration
             
             # ✅ FIXED: Clean activity name - HARUS DI DALAM LOOP!
-            activity['name'] = self.clean_activity_name(activity['name'], time_context)
+            activity.name = self.clean_activity_name(activity.name, time_context)
+        
+        result = (activities, target_day, recurring_pattern, time_context)
+        if self.parse_cache is not None:
+            self.parse_cache.put(key, result)
+        
+        return result
+    
+    def parse_preview(self, sentence: str) -> Dict:
+        """Parse-only preview: tanpa scheduling, suggestions, display & database"""
+        activities, target_day, recurring_pattern, time_context = self.context_aware_parse(sentence)
+        day_references = {offset: keyword for keyword, offset in self.day_keywords.items()}
+        
+        detected = [{
+            'name': activity.name,
+            'hours': activity.hours,
+            'sessions': activity.sessions,
+            'priority': activity.priority,
+            'type': activity.type,
+            'category': activity.analysis['category']
+        } for activity in activities]
         
-        return activities, target_day, recurring_pattern, time_context
+        return {
+            'activities': detected,
+            'total_hours': sum(activity['hours'] * activity['sessions'] for activity in detected),
+            'target_day': target_day,
+            'day_reference': day_references.get(target_day),
+            'recurring': recurring_pattern,
+            'time_context': time_context.to_dict()
+        }
     
+    def normalize_sentence(self, sentence: str) -> str:
+        """Lowercase + collapse whitespace - dipakai sebagai cache key"""
+        return ' '.join(sentence.lower().split())
     
-    def generate_smart_suggestions(self, schedule: List[Dict], activities: List[Dict], time_context: Dict) -> List[str]:
+    
+    def generate_smart_suggestions(self, schedule: List[Event], activities: List[Activity], time_context: TimeContext) -> List[str]:
         """Generate intelligent suggestions berdasarkan best practices"""
         suggestions = []
         
@@ -228,14 +1474,14 @@ class UltimateScheduler:
         # 1. Check for long focus sessions without breaks
         focus_streak = 0
         for i, event in enumerate(schedule):
-            if event['name'] == 'BREAK':
+            if event.name == 'BREAK':
                 focus_streak = 0
             else:
-                focus_streak += event['hours']
+                focus_streak += event.hours
                 
                 if focus_streak >= 3.0:
                     suggestions.append(
-                        f"💡 Consider adding break setelah {event['name']} "
+                        f"💡 Consider adding break setelah {event.name} "
                         f"(sudah {focus_streak} jam fokus terus)"
                     )
         
@@ -261,18 +1507,18 @@ class UltimateScheduler:
         
         return suggestions[:5]  # Return top 5 suggestions
 
-    def analyze_energy_distribution(self, schedule: List[Dict]) -> Tuple[float, float, float]:
+    def analyze_energy_distribution(self, schedule: List[Event]) -> Tuple[float, float, float]:
         """Analyze energy distribution throughout the day"""
         morning_hours = 0
         afternoon_hours = 0 
         evening_hours = 0
         
         for event in schedule:
-            if event['name'] == 'BREAK':
+            if event.name == 'BREAK':
                 continue
                 
-            start_hour = int(event['start'][11:13])
-            duration = event['hours']
+            start_hour = event.start_min % MINUTES_PER_DAY // 60
+            duration = event.hours
             
             if 6 <= start_hour < 12:
                 morning_hours += duration
@@ -287,7 +1533,7 @@ class UltimateScheduler:
             
         return (morning_hours/total, afternoon_hours/total, evening_hours/total)
 
-    def check_activity_sequencing(self, schedule: List[Dict]) -> List[str]:
+    def check_activity_sequencing(self, schedule: List[Event]) -> List[str]:
         """Check untuk optimal activity sequencing"""
         suggestions = []
         
@@ -295,17 +1541,17 @@ class UltimateScheduler:
             current = schedule[i]
             next_event = schedule[i + 1]
             
-            if current['name'] == 'BREAK' or next_event['name'] == 'BREAK':
+            if current.name == 'BREAK' or next_event.name == 'BREAK':
                 continue
                 
-            current_analysis = current.get('analysis', {})
-            next_analysis = next_event.get('analysis', {})
+            current_analysis = current.analysis or {}
+            next_analysis = next_event.analysis or {}
             
             # Avoid high cognitive load back-to-back
             if (current_analysis.get('cognitive_load') == 'high' and 
                 next_analysis.get('cognitive_load') == 'high'):
                 suggestions.append(
-                    f"🧠 Consider break antara {current['name']} dan {next_event['name']} "
+                    f"🧠 Consider break antara {current.name} dan {next_event.name} "
                     f"(keduanya high cognitive load)"
                 )
             
@@ -313,34 +1559,34 @@ class UltimateScheduler:
             if (current_analysis.get('cognitive_load') == 'high' and 
                 next_analysis.get('energy_required') == 'high'):
                 suggestions.append(
-                    f"💪 Good sequencing! {next_event['name']} setelah {current['name']} "
+                    f"💪 Good sequencing! {next_event.name} setelah {current.name} "
                     f"bagus untuk refresh mental"
                 )
         
         return suggestions
 
-    def optimize_durations(self, activities: List[Dict], schedule: List[Dict]) -> List[str]:
+    def optimize_durations(self, activities: List[Activity], schedule: List[Event]) -> List[str]:
         """Suggest duration optimizations"""
         suggestions = []
         
         for activity in activities:
-            if 'suggested_duration' in activity:
-                current_duration = activity['hours']
-                suggested = activity['suggested_duration']
+            if activity.suggested_duration is not None:
+                current_duration = activity.hours
+                suggested = activity.suggested_duration
                 
                 if abs(current_duration - suggested) > 0.5:
                     suggestions.append(
-                        f"⏱️ {activity['name']}: {current_duration} jam → {suggested} jam "
-                        f"(optimal untuk {activity['analysis']['category']})"
+                        f"⏱️ {activity.name}: {current_duration} jam → {suggested} jam "
+                        f"(optimal untuk {activity.analysis['category']})"
                     )
         
         return suggestions
 
-    def optimize_breaks(self, schedule: List[Dict]) -> List[str]:
+    def optimize_breaks(self, schedule: List[Event]) -> List[str]:
         """Optimize break placement"""
         suggestions = []
-        break_count = sum(1 for event in schedule if event['name'] == 'BREAK')
-        productive_hours = sum(event['hours'] for event in schedule if event['name'] != 'BREAK')
+        break_count = sum(1 for event in schedule if event.name == 'BREAK')
+        productive_hours = sum(event.hours for event in schedule if event.name != 'BREAK')
         
         # Ideal break frequency
         ideal_breaks = max(1, int(productive_hours / 2))
@@ -360,8 +1606,7 @@ class UltimateScheduler:
 
     def setup_database(self):
         """Setup SQLite database untuk history & analytics"""
-        self.db_path = Path("scheduler_history.db")
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -371,10 +1616,17 @@ class UltimateScheduler:
                 schedule_data TEXT,
                 productivity_score REAL,
                 total_hours REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                uid TEXT
             )
         ''')
         
+        # uid: id publik untuk GET/PATCH /schedule/{id}, di-generate saat request (sebelum write-behind flush)
+        if 'uid' not in {column[1] for column in cursor.execute('PRAGMA table_info(schedules)')}:
+            cursor.execute('ALTER TABLE schedules ADD COLUMN uid TEXT')
+        cursor.execute('UPDATE schedules SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_schedules_uid ON schedules (uid)')
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS activities (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -387,56 +1639,838 @@ class UltimateScheduler:
             )
         ''')
         
+        # Events ter-normalisasi (start/end per event) untuk query time-range & per-activity lewat index
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                schedule_id INTEGER NOT NULL,
+                activity_name TEXT NOT NULL,
+                start_time TEXT,
+                end_time TEXT,
+                session INTEGER,
+                total_sessions INTEGER,
+                type TEXT,
+                priority TEXT,
+                day_offset INTEGER,
+                hours REAL,
+                conflict_resolved BOOLEAN DEFAULT FALSE,
+                FOREIGN KEY (schedule_id) REFERENCES schedules (id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_start ON events (start_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_activity_start ON events (activity_name, start_time)')
+        # (schedule_id, start_time): events satu schedule urut waktu, termasuk satu hari saja untuk edit
+        cursor.execute('DROP INDEX IF EXISTS idx_events_schedule')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_schedule_start ON events (schedule_id, start_time)')
+        
+        # Rollups: di-update saat insert supaya /analytics tidak perlu scan semua history
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_schedules INTEGER NOT NULL DEFAULT 0,
+                efficiency_sum REAL NOT NULL DEFAULT 0,
+                hours_sum REAL NOT NULL DEFAULT 0,
+                last_created TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                date TEXT PRIMARY KEY,
+                schedule_count INTEGER NOT NULL DEFAULT 0,
+                efficiency_sum REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_activities (
+                activity_name TEXT PRIMARY KEY,
+                frequency INTEGER NOT NULL DEFAULT 0,
+                duration_sum REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_activities_frequency ON rollup_activities (frequency)')
+        
         conn.commit()
-        conn.close()
-        print("✅ Database setup complete")
+        
+        # Database lama (sebelum ada rollups): backfill sekali dari history
+        if cursor.execute('SELECT 1 FROM rollup_totals').fetchone() is None:
+            self.rebuild_rollups()
+        
+        # Database lama (schedule_data JSON blob): pindahkan ke events sekali
+        if cursor.execute('SELECT 1 FROM events LIMIT 1').fetchone() is None:
+            self.backfill_events()
+        
+        logger.info("Database setup complete: %s", self.db_path)
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """Long-lived connection untuk thread ini (WAL + synchronous=NORMAL)"""
+        conn = getattr(self.db_local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False hanya supaya close() bisa dipanggil dari thread lain;
+            # setiap connection tetap dipakai oleh thread pemiliknya saja
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.db_local.conn = conn
+            with self.db_lock:
+                self.db_connections.append(conn)
+        return conn
+    
+    def close(self):
+        """Drain history queue, stop day pool, lalu tutup semua connection yang pernah dibuka"""
+        if self.history_writer:
+            self.history_writer.close()
+        if self.day_pool:
+            self.day_pool.shutdown(wait=True)
+            self.day_pool = None
+        with self.db_lock:
+            connections, self.db_connections = self.db_connections, []
+        for conn in connections:
+            conn.close()
+        self.db_local = threading.local()
+    
+    def record_history(self, input_text: str, schedule: List[Dict], metrics: Dict) -> str:
+        """Simpan history lewat write-behind queue kalau aktif, kalau tidak langsung.
+        created_at & uid diambil sekarang (bukan saat flush); return uid schedule"""
+        created_at = self.utc_timestamp()
+        uid = uuid.uuid4().hex
+        if self.history_writer:
+            self.history_writer.submit((input_text, schedule, metrics, created_at, uid))
+        else:
+            self.save_schedule_history(input_text, schedule, metrics, created_at, uid)
+        return uid
     
-    def save_schedule_history(self, input_text: str, schedule: List[Dict], metrics: Dict):
+    def record_history_batch(self, entries: List[Tuple[str, List[Dict], Dict]]) -> List[str]:
+        created_at = self.utc_timestamp()
+        entries = [(*entry, created_at, uuid.uuid4().hex) for entry in entries]
+        if self.history_writer:
+            self.history_writer.submit_many(entries)
+        else:
+            self.save_schedule_history_batch(entries)
+        return [entry[-1] for entry in entries]
+    
+    def save_schedule_history(self, input_text: str, schedule: List[Dict], metrics: Dict,
+                              created_at: Optional[str] = None, uid: Optional[str] = None):
         """Save schedule ke database untuk analytics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Save main schedule
-        cursor.execute('''
-            INSERT INTO schedules (input_text, schedule_data, productivity_score, total_hours)
-            VALUES (?, ?, ?, ?)
-        ''', (input_text, json.dumps(schedule), metrics['efficiency_score'], metrics['total_hours']))
+        conn = self.get_connection()
+        with conn:
+            self.insert_schedule_rows(conn.cursor(), input_text, schedule, metrics, created_at, uid)
+        self.invalidate_analytics()
+        logger.debug("Schedule saved to history")
+    
+    def save_schedule_history_batch(self, entries: List[Tuple]):
+        """Save banyak schedule dalam satu transaction; entry = (input_text, schedule, metrics[, created_at[, uid]])"""
+        if not entries:
+            return
+        
+        conn = self.get_connection()
+        with conn:
+            cursor = conn.cursor()
+            for entry in entries:
+                self.insert_schedule_rows(cursor, *entry)
+        self.invalidate_analytics()
+        logger.debug("%d schedules saved to history", len(entries))
+    
+    # SQL string yang sama dipakai ulang -> statement cache sqlite3 per connection
+    INSERT_SCHEDULE_SQL = '''
+        INSERT INTO schedules (input_text, productivity_score, total_hours, created_at, uid)
+        VALUES (?, ?, ?, ?, ?)
+    '''
+    INSERT_EVENT_SQL = '''
+        INSERT INTO events (schedule_id, activity_name, start_time, end_time, session, total_sessions,
+                            type, priority, day_offset, hours, conflict_resolved)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    INSERT_ACTIVITY_SQL = '''
+        INSERT INTO activities (schedule_id, activity_name, duration, priority)
+        VALUES (?, ?, ?, ?)
+    '''
+    
+    UPDATE_TOTALS_SQL = '''
+        INSERT INTO rollup_totals (id, total_schedules, efficiency_sum, hours_sum, last_created)
+        SELECT 1, 1, productivity_score, total_hours, created_at FROM schedules WHERE id = ?
+        ON CONFLICT (id) DO UPDATE SET
+            total_schedules = total_schedules + 1,
+            efficiency_sum = efficiency_sum + excluded.efficiency_sum,
+            hours_sum = hours_sum + excluded.hours_sum,
+            last_created = MAX(COALESCE(last_created, ''), excluded.last_created)
+    '''
+    UPDATE_DAILY_SQL = '''
+        INSERT INTO rollup_daily (date, schedule_count, efficiency_sum)
+        SELECT DATE(created_at), 1, productivity_score FROM schedules WHERE id = ?
+        ON CONFLICT (date) DO UPDATE SET
+            schedule_count = schedule_count + 1,
+            efficiency_sum = efficiency_sum + excluded.efficiency_sum
+    '''
+    UPDATE_ACTIVITY_SQL = '''
+        INSERT INTO rollup_activities (activity_name, frequency, duration_sum)
+        VALUES (?, 1, ?)
+        ON CONFLICT (activity_name) DO UPDATE SET
+            frequency = frequency + 1,
+            duration_sum = duration_sum + excluded.duration_sum
+    '''
+    
+    def insert_schedule_rows(self, cursor: sqlite3.Cursor, input_text: str, schedule: List[Dict], metrics: Dict,
+                             created_at: Optional[str] = None, uid: Optional[str] = None) -> int:
+        """Insert satu schedule + activities + update rollups (tanpa commit)"""
+        # Save main schedule (events di tabel sendiri, schedule_data hanya untuk row lama)
+        cursor.execute(self.INSERT_SCHEDULE_SQL, (input_text, metrics['efficiency_score'], metrics['total_hours'],
+                                                  created_at or self.utc_timestamp(), uid or uuid.uuid4().hex))
         
         schedule_id = cursor.lastrowid
+        cursor.executemany(self.INSERT_EVENT_SQL, self.event_rows(schedule_id, schedule))
         
         # Save individual activities
-        for event in schedule:
-            if event['name'] != 'BREAK':
-                cursor.execute('''
-                    INSERT INTO activities (schedule_id, activity_name, duration, priority)
-                    VALUES (?, ?, ?, ?)
-                ''', (schedule_id, event['name'], event.get('hours', 1), event.get('priority', 'medium')))
+        activities = self.activity_rows(schedule_id, schedule)
+        cursor.executemany(self.INSERT_ACTIVITY_SQL, activities)
         
-        conn.commit()
-        conn.close()
-        print("💾 Schedule saved to history")
+        # Rollups ikut transaction yang sama
+        cursor.execute(self.UPDATE_TOTALS_SQL, (schedule_id,))
+        cursor.execute(self.UPDATE_DAILY_SQL, (schedule_id,))
+        cursor.executemany(self.UPDATE_ACTIVITY_SQL, [(name, duration) for _, name, duration, _ in activities])
+        
+        return schedule_id
     
-    def get_analytics(self) -> Dict:
-        """Get productivity analytics dari history"""
-        conn = sqlite3.connect(self.db_path)
+    def activity_rows(self, schedule_id: int, schedule: List[Dict]) -> List[Tuple]:
+        """Serialized schedule -> parameter rows untuk INSERT_ACTIVITY_SQL (tanpa BREAK)"""
+        return [
+            (schedule_id, event['name'], event.get('hours', 1), event.get('priority', 'medium'))
+            for event in schedule if event['name'] != 'BREAK'
+        ]
+    
+    def event_rows(self, schedule_id: int, schedule: List[Dict]) -> List[Tuple]:
+        """Serialized schedule -> parameter rows untuk INSERT_EVENT_SQL"""
+        return [
+            (schedule_id, event['name'], event.get('start'), event.get('end'), event.get('session'),
+             event.get('total_sessions'), event.get('type'), event.get('priority'), event.get('day_offset'),
+             event.get('hours'), event.get('conflict_resolved', False))
+            for event in schedule
+        ]
+    
+    def backfill_events(self, chunk_size: int = 1000):
+        """Decode schedule_data JSON (row lama) ke events table, per chunk"""
+        conn = self.get_connection()
+        reader = conn.execute('''
+            SELECT id, schedule_data FROM schedules
+            WHERE schedule_data IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM events WHERE events.schedule_id = schedules.id)
+        ''')
+        migrated = 0
+        while True:
+            rows = reader.fetchmany(chunk_size)
+            if not rows:
+                break
+            with conn:
+                for schedule_id, schedule_data in rows:
+                    conn.executemany(self.INSERT_EVENT_SQL, self.event_rows(schedule_id, json.loads(schedule_data)))
+            migrated += len(rows)
+        if migrated:
+            logger.info("Backfilled events for %d schedules", migrated)
+    
+    EVENT_COLUMNS = '''
+        schedule_id, activity_name, start_time, end_time, session, total_sessions,
+        type, priority, day_offset, hours, conflict_resolved
+    '''
+    
+    def event_from_row(self, row: Tuple) -> Dict:
+        """Row EVENT_COLUMNS -> event dict (format sama dengan serialize_schedule + schedule_id)"""
+        return {
+            'schedule_id': row[0], 'name': row[1], 'start': row[2], 'end': row[3],
+            'session': row[4], 'total_sessions': row[5], 'type': row[6], 'priority': row[7],
+            'day_offset': row[8], 'hours': row[9], 'conflict_resolved': bool(row[10])
+        }
+    
+    def query_events(self, start: str, end: str, activity_name: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+        """Events yang mulai di [start, end) (ISO), opsional untuk satu activity; index range scan"""
+        sql = f'''
+            SELECT {self.EVENT_COLUMNS}
+            FROM events
+            WHERE start_time >= ? AND start_time < ?
+        '''
+        params = [start, end]
+        if activity_name is not None:
+            sql += ' AND activity_name = ?'
+            params.append(activity_name)
+        sql += ' ORDER BY start_time LIMIT ?'
+        params.append(limit)
+        
+        rows = self.get_connection().execute(sql, params).fetchall()
+        return [self.event_from_row(row) for row in rows]
+    
+    def get_history_page(self, after_id: Optional[int] = None, limit: int = 100) -> Dict:
+        """Keyset pagination atas schedules.id (ascending = urutan insert; schedule hasil import bisa punya
+        created_at lebih lama dari id sebelumnya)"""
+        conn = self.get_connection()
+        rows = conn.execute('''
+            SELECT id, uid, input_text, productivity_score, total_hours, created_at
+            FROM schedules
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (after_id or 0, limit)).fetchall()
+        if not rows:
+            return {'items': [], 'next_cursor': None}
+        
+        # Events untuk seluruh page dalam satu range scan di idx_events_schedule_start
+        events_by_schedule = {}
+        for row in conn.execute(f'''
+            SELECT {self.EVENT_COLUMNS}
+            FROM events
+            WHERE schedule_id BETWEEN ? AND ?
+            ORDER BY schedule_id, start_time, id
+        ''', (rows[0][0], rows[-1][0])):
+            event = self.event_from_row(row)
+            events_by_schedule.setdefault(event.pop('schedule_id'), []).append(event)
+        
+        items = [
+            {
+                'id': schedule_id,
+                'uid': uid,
+                'input_text': input_text,
+                'productivity_score': productivity_score,
+                'total_hours': total_hours,
+                'created_at': created_at,
+                'schedule': events_by_schedule.get(schedule_id, [])
+            }
+            for schedule_id, uid, input_text, productivity_score, total_hours, created_at in rows
+        ]
+        next_cursor = rows[-1][0] if len(rows) == limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+    
+    def iter_history(self, after_id: Optional[int] = None, chunk_size: int = 1000):
+        """Stream seluruh history per chunk (memory tetap O(chunk_size), tanpa long-running read transaction)"""
+        while True:
+            page = self.get_history_page(after_id, chunk_size)
+            yield from page['items']
+            if page['next_cursor'] is None:
+                return
+            after_id = page['next_cursor']
+    
+    def get_schedule(self, uid: str) -> Optional[Dict]:
+        """Satu stored schedule (events dengan id, urut waktu) atau None"""
+        conn = self.get_connection()
+        row = self.find_schedule_row(conn, uid)
+        if row is None:
+            return None
+        schedule_id, productivity_score, total_hours, created_at, input_text = row
+        
+        schedule = []
+        for event_row in conn.execute(f'''
+            SELECT id, {self.EVENT_COLUMNS}
+            FROM events
+            WHERE schedule_id = ?
+            ORDER BY start_time, id
+        ''', (schedule_id,)):
+            event = self.event_from_row(event_row[1:])
+            del event['schedule_id']
+            schedule.append({'id': event_row[0], **event})
+        
+        return {
+            'schedule_id': uid,
+            'input_text': input_text,
+            'created_at': created_at,
+            'metrics': {'efficiency_score': productivity_score, 'total_hours': total_hours},
+            'schedule': schedule
+        }
+    
+    # Detik maksimum lookup menunggu uid yang masih di write-behind queue
+    HISTORY_LOOKUP_TIMEOUT = 5.0
+    
+    def find_schedule_row(self, conn: sqlite3.Connection, uid: str) -> Optional[Tuple]:
+        """Lookup by uid; kalau uid masih antri di write-behind queue, tunggu entry itu saja tertulis"""
+        sql = '''
+            SELECT id, productivity_score, total_hours, created_at, input_text
+            FROM schedules WHERE uid = ?
+        '''
+        row = conn.execute(sql, (uid,)).fetchone()
+        if row is None and self.history_writer and self.history_writer.wait_for(uid, self.HISTORY_LOOKUP_TIMEOUT):
+            row = conn.execute(sql, (uid,)).fetchone()
+        return row
+    
+    EDIT_OPERATIONS = ('add', 'move', 'remove')
+    
+    def edit_schedule(self, uid: str, operation: Dict) -> Dict:
+        """Incremental edit satu stored schedule: add / move / remove satu event.
+        Hanya timeline hari yang terkena yang dibaca, conflict dicek ke neighbouring events,
+        metrics & rollups di-update dengan delta. Return diff.
+        KeyError kalau schedule / event tidak ada, ValueError kalau operation tidak valid."""
+        op = operation.get('op')
+        if op not in self.EDIT_OPERATIONS:
+            raise ValueError(f"op must be one of {list(self.EDIT_OPERATIONS)}")
+        
+        conn = self.get_connection()
+        row = self.find_schedule_row(conn, uid)
+        if row is None:
+            raise KeyError(f"Schedule {uid} not found")
+        schedule_id, efficiency, total_hours, created_at, _ = row
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            diff = {'added': [], 'moved': [], 'removed': [], 'conflicts': []}
+            target = None
+            if op in ('move', 'remove'):
+                target = self.fetch_event(conn, schedule_id, operation.get('event_id'))
+            
+            if op == 'remove':
+                self.delete_event(conn, schedule_id, target)
+                diff['removed'].append(target)
+                duration_delta = -self.event_hours(target)
+            else:
+                start, end = self.edit_window(operation, target)
+                day_offset = self.edit_day_offset(conn, schedule_id, start, target)
+                neighbours = self.day_events(conn, schedule_id, start, end, exclude_id=target and target['id'])
+                
+                if op == 'add':
+                    event = self.added_event(operation, start, end, day_offset)
+                    event['id'] = self.insert_event(conn, schedule_id, event)
+                    diff['added'].append(event)
+                    duration_delta = self.event_hours(event)
+                else:
+                    event = {**target, 'start': start.isoformat(), 'end': end.isoformat(), 'day_offset': day_offset}
+                    # Move dengan end eksplisit bisa mengubah durasi
+                    duration_delta = self.event_hours(event) - self.event_hours(target)
+                    if duration_delta:
+                        event['hours'] = self.event_hours(event)
+                        self.resize_activity(conn, schedule_id, target, event['hours'])
+                    conn.execute('''
+                        UPDATE events SET start_time = ?, end_time = ?, day_offset = ?, hours = ? WHERE id = ?
+                    ''', (event['start'], event['end'], day_offset, event['hours'], target['id']))
+                    diff['moved'].append({'id': target['id'], 'name': target['name'],
+                                          'from': {'start': target['start'], 'end': target['end']},
+                                          'to': {'start': event['start'], 'end': event['end']}})
+                
+                diff['conflicts'] = self.neighbour_conflicts(neighbours, event)
+            
+            if duration_delta:
+                is_break = (target or event)['name'] == 'BREAK'
+                diff['metrics'] = self.apply_metrics_delta(conn, schedule_id, created_at, efficiency, total_hours,
+                                                           duration_delta, is_break)
+            else:
+                diff['metrics'] = {'efficiency_score': efficiency, 'total_hours': total_hours}
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        self.invalidate_analytics()
+        diff['schedule_id'] = uid
+        return diff
+    
+    def fetch_event(self, conn: sqlite3.Connection, schedule_id: int, event_id) -> Dict:
+        row = conn.execute(f'''
+            SELECT id, {self.EVENT_COLUMNS} FROM events WHERE id = ? AND schedule_id = ?
+        ''', (event_id, schedule_id)).fetchone()
+        if row is None:
+            raise KeyError(f"Event {event_id} not found in schedule")
+        event = self.event_from_row(row[1:])
+        del event['schedule_id']
+        return {'id': row[0], **event}
+    
+    def event_hours(self, event: Dict) -> float:
+        """Durasi event dari start/end (sama dengan calculate_productivity_score)"""
+        start = datetime.fromisoformat(event['start'])
+        end = datetime.fromisoformat(event['end'])
+        return (end - start).total_seconds() / 3600
+    
+    def edit_window(self, operation: Dict, target: Optional[Dict]) -> Tuple[datetime, datetime]:
+        """start/end baru: add butuh start + (end | hours), move butuh start (durasi tetap kecuali end dikirim)"""
+        start = self.local_datetime(operation.get('start'), 'start')
+        
+        if operation.get('end') is not None:
+            end = self.local_datetime(operation['end'], 'end')
+        elif target is not None:
+            end = start + (datetime.fromisoformat(target['end']) - datetime.fromisoformat(target['start']))
+        elif isinstance(operation.get('hours'), (int, float)) and operation['hours'] > 0:
+            end = start + timedelta(minutes=to_minutes(operation['hours']))
+        else:
+            raise ValueError("add needs end or positive hours")
+        
+        if end <= start:
+            raise ValueError("end must be after start")
+        return start, end
+    
+    def local_datetime(self, value, field: str) -> datetime:
+        """ISO datetime -> naive local time seperti events tersimpan (offset dikonversi ke timezone scheduler)"""
+        try:
+            moment = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be an ISO datetime")
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(self.tz).replace(tzinfo=None)
+        return moment
+    
+    def edit_day_offset(self, conn: sqlite3.Connection, schedule_id: int, start: datetime,
+                        target: Optional[Dict]) -> Optional[int]:
+        """day_offset untuk tanggal start, relatif ke event lain di schedule yang sama"""
+        anchor = conn.execute('''
+            SELECT start_time, day_offset FROM events
+            WHERE schedule_id = ? AND day_offset IS NOT NULL
+            ORDER BY start_time LIMIT 1
+        ''', (schedule_id,)).fetchone()
+        if anchor is None:
+            return target['day_offset'] if target else None
+        anchor_date = datetime.fromisoformat(anchor[0]).date()
+        return anchor[1] + (start.date() - anchor_date).days
+    
+    def day_events(self, conn: sqlite3.Connection, schedule_id: int, start: datetime, end: datetime,
+                   exclude_id: Optional[int] = None) -> List[Dict]:
+        """Timeline di sekitar [start, end): range scan di idx_events_schedule_start mulai sehari sebelumnya,
+        jadi session yang lewat tengah malam dari hari sebelumnya ikut terbaca"""
+        rows = conn.execute('''
+            SELECT id, activity_name, start_time, end_time FROM events
+            WHERE schedule_id = ? AND start_time >= ? AND start_time < ? AND end_time > ?
+            ORDER BY start_time
+        ''', (schedule_id, (start - timedelta(days=1)).isoformat(), end.isoformat(), start.isoformat())).fetchall()
+        return [{'id': row[0], 'name': row[1], 'start': row[2], 'end': row[3]}
+                for row in rows if row[0] != exclude_id]
+    
+    def neighbour_conflicts(self, day_events: List[Dict], event: Dict) -> List[Dict]:
+        """Overlap dengan semua event sebelumnya yang belum selesai saat event mulai
+        + events berikutnya yang mulai sebelum event selesai"""
+        starts = [neighbour['start'] for neighbour in day_events]
+        position = bisect_left(starts, event['start'])
+        candidates = [neighbour for neighbour in day_events[:position] if neighbour['end'] > event['start']]
+        for neighbour in day_events[position:]:
+            if neighbour['start'] >= event['end']:
+                break
+            candidates.append(neighbour)
+        return [
+            {'event_id': event['id'], 'with_event_id': neighbour['id'], 'with': neighbour['name'],
+             'start': max(event['start'], neighbour['start']), 'end': min(event['end'], neighbour['end'])}
+            for neighbour in candidates
+            if neighbour['start'] < event['end'] and neighbour['end'] > event['start']
+        ]
+    
+    def added_event(self, operation: Dict, start: datetime, end: datetime, day_offset: Optional[int]) -> Dict:
+        name = operation.get('name')
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("name is required")
+        priority = operation.get('priority', 'medium')
+        if priority not in self.priority_weights:
+            raise ValueError(f"priority must be one of {sorted(self.priority_weights)}")
+        is_break = name == 'BREAK'
+        return {
+            'name': name,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'session': '-' if is_break else 1,
+            'total_sessions': '-' if is_break else 1,
+            'type': 'break' if is_break else 'flexible',
+            'priority': priority,
+            'day_offset': day_offset,
+            'hours': operation.get('hours', (end - start).total_seconds() / 3600)
+        }
+    
+    def insert_event(self, conn: sqlite3.Connection, schedule_id: int, event: Dict) -> int:
         cursor = conn.cursor()
+        cursor.execute(self.INSERT_EVENT_SQL, self.event_rows(schedule_id, [event])[0])
+        event_id = cursor.lastrowid
+        for activity in self.activity_rows(schedule_id, [event]):
+            cursor.execute(self.INSERT_ACTIVITY_SQL, activity)
+            cursor.execute(self.UPDATE_ACTIVITY_SQL, (activity[1], activity[2]))
+        return event_id
+    
+    def activity_row(self, conn: sqlite3.Connection, schedule_id: int, event: Dict) -> Optional[Tuple]:
+        """(id, duration) row activities milik event (satu row per non-BREAK event, durasi sama diutamakan)"""
+        return conn.execute('''
+            SELECT id, duration FROM activities WHERE schedule_id = ? AND activity_name = ?
+            ORDER BY duration = ? DESC, id LIMIT 1
+        ''', (schedule_id, event['name'], event.get('hours'))).fetchone()
+    
+    def resize_activity(self, conn: sqlite3.Connection, schedule_id: int, event: Dict, hours: float):
+        if event['name'] == 'BREAK':
+            return
+        activity = self.activity_row(conn, schedule_id, event)
+        if activity is None:
+            return
+        conn.execute('UPDATE activities SET duration = ? WHERE id = ?', (hours, activity[0]))
+        conn.execute('''
+            UPDATE rollup_activities SET duration_sum = duration_sum + ? WHERE activity_name = ?
+        ''', (hours - activity[1], event['name']))
+    
+    def delete_event(self, conn: sqlite3.Connection, schedule_id: int, event: Dict):
+        conn.execute('DELETE FROM events WHERE id = ?', (event['id'],))
+        if event['name'] == 'BREAK':
+            return
+        activity = self.activity_row(conn, schedule_id, event)
+        if activity is None:
+            return
+        conn.execute('DELETE FROM activities WHERE id = ?', (activity[0],))
+        conn.execute('''
+            UPDATE rollup_activities SET frequency = frequency - 1, duration_sum = duration_sum - ?
+            WHERE activity_name = ?
+        ''', (activity[1], event['name']))
+        conn.execute('DELETE FROM rollup_activities WHERE activity_name = ? AND frequency <= 0', (event['name'],))
+    
+    def apply_metrics_delta(self, conn: sqlite3.Connection, schedule_id: int, created_at: str, efficiency: float,
+                            total_hours: float, duration_delta: float, is_break: bool) -> Dict:
+        """efficiency = productive / total -> geser productive / break hours dengan delta, update schedule + rollups"""
+        productive = (efficiency or 0) * (total_hours or 0)
+        breaks = (total_hours or 0) - productive
+        if is_break:
+            breaks = max(breaks + duration_delta, 0)
+        else:
+            productive = max(productive + duration_delta, 0)
+        new_total = productive + breaks
+        new_efficiency = productive / new_total if new_total > 0 else 0
+        
+        conn.execute('UPDATE schedules SET productivity_score = ?, total_hours = ? WHERE id = ?',
+                     (new_efficiency, new_total, schedule_id))
+        conn.execute('''
+            UPDATE rollup_totals SET efficiency_sum = efficiency_sum + ?, hours_sum = hours_sum + ? WHERE id = 1
+        ''', (new_efficiency - (efficiency or 0), new_total - (total_hours or 0)))
+        conn.execute('''
+            UPDATE rollup_daily SET efficiency_sum = efficiency_sum + ? WHERE date = DATE(?)
+        ''', (new_efficiency - (efficiency or 0), created_at))
+        return {'efficiency_score': new_efficiency, 'total_hours': new_total,
+                'productive_hours': productive, 'break_hours': breaks}
+    
+    IMPORT_EVENT_TYPES = {'fixed', 'flexible', 'break'}
+    IMPORT_CSV_FIELDS = {'session': int, 'total_sessions': int, 'day_offset': int, 'hours': float,
+                         'productivity_score': float, 'total_hours': float}
+    MAX_IMPORT_ERRORS = 100
+    
+    def import_history(self, lines, fmt: str = 'ndjson', chunk_size: int = 5000) -> Dict:
+        """Bulk import history (NDJSON: satu schedule per baris, format sama dengan GET /history;
+        CSV: satu event per baris, di-group per schedule_ref). Streaming, chunked transactions,
+        rollups di-rebuild sekali di akhir."""
+        if fmt not in ('ndjson', 'csv'):
+            raise ValueError(f"Unsupported import format: {fmt}")
+        
+        decode = json.loads if fmt == 'ndjson' else self.record_from_csv_rows
+        conn = self.get_connection()
+        imported = 0
+        errors = []
+        failed = 0
+        chunk = []
+        
+        for line_no, raw in self.iter_import_records(lines, fmt):
+            try:
+                chunk.append(self.parse_import_record(decode(raw)))
+            except (ValueError, TypeError, KeyError) as e:
+                failed += 1
+                if len(errors) < self.MAX_IMPORT_ERRORS:
+                    errors.append({'line': line_no, 'error': str(e)})
+                continue
+            if len(chunk) >= chunk_size:
+                imported += self.insert_import_chunk(conn, chunk)
+                chunk = []
+        if chunk:
+            imported += self.insert_import_chunk(conn, chunk)
+        
+        if imported:
+            self.rebuild_rollups()
+        logger.info("History import: %d imported, %d failed", imported, failed)
+        return {'imported': imported, 'failed': failed, 'errors': errors}
+    
+    def iter_import_records(self, lines, fmt: str):
+        """Yield (line_no, raw record); CSV rows berurutan dengan schedule_ref sama = satu schedule"""
+        if fmt == 'ndjson':
+            for line_no, line in enumerate(lines, 1):
+                if line.strip():
+                    yield line_no, line
+            return
+        
+        reader = csv.DictReader(lines)
+        group, group_ref, group_line = [], None, 0
+        for row in reader:
+            ref = row.get('schedule_ref')
+            if group and ref != group_ref:
+                yield group_line, group
+                group = []
+            if not group:
+                group_ref, group_line = ref, reader.line_num
+            group.append(row)
+        if group:
+            yield group_line, group
+    
+    def record_from_csv_rows(self, rows: List[Dict]) -> Dict:
+        """CSV rows satu schedule -> record dengan bentuk yang sama seperti NDJSON"""
+        def convert(row: Dict, fields) -> Dict:
+            values = {}
+            for field in fields:
+                value = row.get(field)
+                if value is None or value == '':
+                    continue
+                if field in self.IMPORT_CSV_FIELDS:
+                    value = self.IMPORT_CSV_FIELDS[field](value) if value != '-' else value
+                elif field == 'conflict_resolved':
+                    value = value.strip().lower() in ('1', 'true', 'yes')
+                values[field] = value
+            return values
+        
+        record = convert(rows[0], ('input_text', 'created_at', 'productivity_score', 'total_hours'))
+        record['schedule'] = [
+            convert(row, ('name', 'start', 'end', 'session', 'total_sessions', 'type', 'priority',
+                          'day_offset', 'hours', 'conflict_resolved'))
+            for row in rows
+        ]
+        return record
+    
+    def parse_import_record(self, record: Dict) -> Tuple[str, List[Dict], Dict, Optional[str]]:
+        """Validasi satu record terhadap bentuk event dari schedule_single_day.
+        Return (input_text, serialized schedule, metrics, created_at)"""
+        if not isinstance(record, dict):
+            raise ValueError("record must be an object")
+        input_text = record.get('input_text', '')
+        if not isinstance(input_text, str):
+            raise ValueError("input_text must be a string")
+        events = record.get('schedule')
+        if not isinstance(events, list) or not events:
+            raise ValueError("schedule must be a non-empty list of events")
+        
+        origin = None
+        timeline = []
+        schedule = []
+        for index, event in enumerate(events):
+            if not isinstance(event, dict) or not isinstance(event.get('name'), str) or not event['name'].strip():
+                raise ValueError(f"event {index}: name is required")
+            # null (mis. export dari row lama) = pakai default
+            event = {key: value for key, value in event.items() if value is not None}
+            try:
+                # Offset dikonversi ke timezone scheduler, disimpan naive seperti event lain
+                start = self.local_datetime(event['start'], 'start')
+                end = self.local_datetime(event['end'], 'end')
+                origin = origin or start.replace(hour=0, minute=0, second=0, microsecond=0)
+                start_min = int((start - origin).total_seconds() // 60)
+                end_min = int((end - origin).total_seconds() // 60)
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"event {index}: start/end must be ISO datetimes")
+            if end_min <= start_min:
+                raise ValueError(f"event {index}: end must be after start")
+            
+            priority = event.get('priority', 'medium')
+            if priority not in self.priority_weights:
+                raise ValueError(f"event {index}: priority must be one of {sorted(self.priority_weights)}")
+            event_type = event.get('type', 'flexible')
+            if event_type not in self.IMPORT_EVENT_TYPES:
+                raise ValueError(f"event {index}: type must be one of {sorted(self.IMPORT_EVENT_TYPES)}")
+            session = event.get('session', 1)
+            total_sessions = event.get('total_sessions', 1)
+            for value in (session, total_sessions):
+                if value != '-' and (type(value) is not int or value < 1):
+                    raise ValueError(f"event {index}: session/total_sessions must be positive integers or '-'")
+            hours = event.get('hours', (end_min - start_min) / 60)
+            if type(hours) not in (int, float) or hours < 0:
+                raise ValueError(f"event {index}: hours must be a non-negative number")
+            day_offset = event.get('day_offset', start_min // MINUTES_PER_DAY)
+            if type(day_offset) is not int:
+                raise ValueError(f"event {index}: day_offset must be an integer")
+            
+            timeline.append(Event(event['name'], start_min, end_min, session, total_sessions,
+                                  event_type, priority, day_offset, hours))
+            serialized_event = {
+                'name': event['name'],
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'session': session,
+                'total_sessions': total_sessions,
+                'type': event_type,
+                'priority': priority,
+                'day_offset': day_offset,
+                'hours': hours
+            }
+            if event.get('conflict_resolved'):
+                serialized_event['conflict_resolved'] = True
+            schedule.append(serialized_event)
+        
+        # Metrics dihitung ulang seperti schedule baru, kecuali record membawa angka sendiri
+        metrics = self.calculate_productivity_score(timeline)
+        if record.get('productivity_score') is not None:
+            metrics['efficiency_score'] = float(record['productivity_score'])
+        if record.get('total_hours') is not None:
+            metrics['total_hours'] = float(record['total_hours'])
+        
+        created_at = record.get('created_at')
+        if created_at is not None:
+            try:
+                # UTC, format sama dengan CURRENT_TIMESTAMP supaya DATE() & urutan konsisten
+                created_at = datetime.fromisoformat(created_at)
+                if created_at.tzinfo:
+                    created_at = created_at.astimezone(timezone.utc)
+                created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                raise ValueError("created_at must be an ISO datetime")
+        
+        return input_text, schedule, metrics, created_at
+    
+    def insert_import_chunk(self, conn: sqlite3.Connection, chunk: List[Tuple]) -> int:
+        """Satu transaction per chunk; id schedule dari SQLite (AUTOINCREMENT), events & activities executemany"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            imported_at = self.utc_timestamp()
+            cursor = conn.cursor()
+            events, activities = [], []
+            for input_text, schedule, metrics, created_at in chunk:
+                cursor.execute(self.INSERT_SCHEDULE_SQL, (input_text, metrics['efficiency_score'],
+                                                          metrics['total_hours'], created_at or imported_at,
+                                                          uuid.uuid4().hex))
+                schedule_id = cursor.lastrowid
+                events.extend(self.event_rows(schedule_id, schedule))
+                activities.extend(self.activity_rows(schedule_id, schedule))
+            conn.executemany(self.INSERT_EVENT_SQL, events)
+            conn.executemany(self.INSERT_ACTIVITY_SQL, activities)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return len(chunk)
+    
+    def rebuild_rollups(self):
+        """Hitung ulang semua rollup dari schedules & activities (backfill / repair)"""
+        conn = self.get_connection()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM rollup_totals')
+            cursor.execute('DELETE FROM rollup_daily')
+            cursor.execute('DELETE FROM rollup_activities')
+            cursor.execute('''
+                INSERT INTO rollup_totals (id, total_schedules, efficiency_sum, hours_sum, last_created)
+                SELECT 1, COUNT(*), COALESCE(SUM(productivity_score), 0), COALESCE(SUM(total_hours), 0), MAX(created_at)
+                FROM schedules
+            ''')
+            cursor.execute('''
+                INSERT INTO rollup_daily (date, schedule_count, efficiency_sum)
+                SELECT DATE(created_at), COUNT(*), COALESCE(SUM(productivity_score), 0)
+                FROM schedules
+                GROUP BY DATE(created_at)
+            ''')
+            cursor.execute('''
+                INSERT INTO rollup_activities (activity_name, frequency, duration_sum)
+                SELECT activity_name, COUNT(*), COALESCE(SUM(duration), 0)
+                FROM activities
+                GROUP BY activity_name
+            ''')
+        self.invalidate_analytics()
+        logger.info("Rollups rebuilt from history")
+    
+    def invalidate_analytics(self):
+        if self.analytics_cache:
+            self.analytics_cache.invalidate()
+    
+    def get_analytics_entry(self) -> Dict:
+        """Analytics + ETag + created (monotonic), lewat TTL cache kalau aktif"""
+        if self.analytics_cache:
+            return self.analytics_cache.get(self.get_analytics)
+        return AnalyticsCache.make_entry(self.get_analytics())
+    
+    def get_analytics(self) -> Dict:
+        """Get productivity analytics dari rollup tables (precomputed saat insert)"""
+        cursor = self.get_connection().cursor()
         
         # Overall stats
         cursor.execute('''
-            SELECT 
-                COUNT(*) as total_schedules,
-                AVG(productivity_score) as avg_efficiency,
-                AVG(total_hours) as avg_hours,
-                MAX(created_at) as last_created
-            FROM schedules
+            SELECT total_schedules, efficiency_sum, hours_sum, last_created
+            FROM rollup_totals
+            WHERE id = 1
         ''')
-        stats = cursor.fetchone()
+        total_schedules, efficiency_sum, hours_sum, last_created = cursor.fetchone() or (0, 0, 0, None)
         
         # Activity frequency
         cursor.execute('''
-            SELECT activity_name, COUNT(*) as frequency, AVG(duration) as avg_duration
-            FROM activities 
-            GROUP BY activity_name 
+            SELECT activity_name, frequency, duration_sum / frequency as avg_duration
+            FROM rollup_activities
             ORDER BY frequency DESC
             LIMIT 10
         ''')
@@ -444,75 +2478,79 @@ class UltimateScheduler:
         
         # Daily productivity trend
         cursor.execute('''
-            SELECT DATE(created_at) as date, AVG(productivity_score) as daily_efficiency
-            FROM schedules
-            GROUP BY DATE(created_at)
+            SELECT date, efficiency_sum / schedule_count as daily_efficiency
+            FROM rollup_daily
             ORDER BY date DESC
             LIMIT 7
         ''')
         trends = cursor.fetchall()
-        
-        conn.close()
+        cursor.close()
         
         return {
-            'total_schedules': stats[0],
-            'average_efficiency': stats[1] or 0,
-            'average_hours': stats[2] or 0,
-            'last_activity': stats[3],
+            'total_schedules': total_schedules,
+            'average_efficiency': efficiency_sum / total_schedules if total_schedules else 0,
+            'average_hours': hours_sum / total_schedules if total_schedules else 0,
+            'last_activity': last_created,
             'top_activities': [{'name': act[0], 'frequency': act[1], 'avg_duration': act[2]} for act in top_activities],
             'weekly_trends': [{'date': trend[0], 'efficiency': trend[1]} for trend in trends]
         }
     
-    def advanced_parse(self, sentence: str) -> Tuple[List[Dict], int, Dict]:
+    def advanced_parse(self, sentence: str, stream: Optional[TokenStream] = None) -> Tuple[List[Activity], int, Dict]:
         """ADVANCED PARSING - FIXED VERSION"""
-        print(f"🧠 Advanced Parsing: '{sentence}'")
+        logger.debug("Advanced parsing: %r", sentence)
         
-        activities = []
-        target_day = 0
-        recurring_pattern = None
-        sentence_lower = sentence.lower()
+        stream = stream or self.lexer.scan(sentence)
+        drop = {'day', 'filler'}
         
         # Step 1: Detect recurring pattern
-        recurring_pattern = self.detect_recurring_pattern(sentence_lower)
+        recurring_pattern = self.recurring_pattern_from_stream(stream)
         if recurring_pattern:
-            print(f"🔄 Detected recurring pattern: {recurring_pattern}")
-            # Remove recurring keywords dari sentence untuk parsing normal
-            for keyword in self.recurring_keywords:
-                sentence_lower = sentence_lower.replace(keyword, '')
+            logger.debug("Detected recurring pattern: %s", recurring_pattern)
+            # Recurring keywords tidak ikut ke activity segments
+            drop.add('recurring')
         
         # Step 2: Day detection (FIXED - hanya return integer)
-        target_day = self.enhanced_day_detection(sentence_lower)
-        
-        # Step 3: Enhanced activity parsing (FIXED - clean sentence dari day keywords)
-        clean_sentence = sentence_lower
-        for day_key in self.day_keywords:
-            clean_sentence = clean_sentence.replace(day_key, '')
+        target_day = self.day_offset_from_stream(stream)
         
-        activities = self.enhanced_activity_parsing(clean_sentence, target_day, recurring_pattern)
+        # Step 3: Activity parsing dari segments (day keywords & filler sudah dibuang lexer)
+        activities = self.parse_activity_segments(stream.segments(drop), target_day, recurring_pattern)
         
         return activities, target_day, recurring_pattern
     
     def detect_recurring_pattern(self, sentence: str) -> Optional[Dict]:
         """Detect recurring patterns seperti 'setiap senin', 'setiap hari'"""
-        if 'setiap' not in sentence:
+        return self.recurring_pattern_from_stream(self.lexer.scan(sentence))
+    
+    def recurring_pattern_from_stream(self, stream: TokenStream) -> Optional[Dict]:
+        """Recurring pattern dari token stream"""
+        if 'setiap' not in stream.found('recurring'):
             return None
             
         pattern = {}
+        tokens = stream.tokens
         
         # Pattern: "setiap senin", "setiap hari jumat"
-        day_matches = re.findall(r'setiap\s+(hari\s+)?(senin|selasa|rabu|kamis|jumat|sabtu|minggu)', sentence)
-        if day_matches:
+        days = []
+        for i, token in enumerate(tokens):
+            if token.text != 'setiap':
+                continue
+            j = i + 1
+            if j < len(tokens) and tokens[j].text == 'hari':
+                j += 1
+            if j < len(tokens) and tokens[j].text in self.weekday_keywords:
+                days.append(self.weekday_keywords[tokens[j].text])
+        if days:
             pattern['type'] = 'weekly'
-            pattern['days'] = [self.recurring_keywords[day[1]] for day in day_matches]
+            pattern['days'] = days
             return pattern
         
         # Pattern: "setiap hari"
-        if 'setiap hari' in sentence:
+        if 'setiap hari' in stream.found('recurring'):
             pattern['type'] = 'daily'
             return pattern
             
         # Pattern: "setiap minggu"
-        if 'setiap minggu' in sentence:
+        if 'setiap minggu' in stream.found('recurring'):
             pattern['type'] = 'weekly'
             pattern['days'] = ['monday']  # Default
             return pattern
@@ -521,33 +2559,27 @@ class UltimateScheduler:
     
     def enhanced_day_detection(self, sentence: str) -> int:
         """Improved day detection - FIXED VERSION"""
-        day_patterns = {
-            'hari ini': 0,
-            'besok': 1, 
-            'lusa': 2,
-            'minggu depan': 7
-        }
-        
-        for pattern, offset in day_patterns.items():
-            if pattern in sentence:
-                print(f"📅 Detected: {pattern} (day +{offset})")
+        return self.day_offset_from_stream(self.lexer.scan(sentence))
+    
+    def day_offset_from_stream(self, stream: TokenStream) -> int:
+        """Day offset dari token stream"""
+        found_days = stream.found('day')
+        for pattern, offset in self.day_keywords.items():
+            if pattern in found_days:
+                logger.debug("Detected day: %s (day +%d)", pattern, offset)
                 return offset
         return 0
     
-    def enhanced_activity_parsing(self, sentence: str, target_day: int, recurring_pattern: Optional[Dict]) -> List[Dict]:
+    def enhanced_activity_parsing(self, sentence: str, target_day: int, recurring_pattern: Optional[Dict]) -> List[Activity]:
         """Enhanced activity parsing dengan better pattern matching"""
+        segments = self.lexer.scan(sentence).segments({'filler'})
+        return self.parse_activity_segments(segments, target_day, recurring_pattern)
+    
+    def parse_activity_segments(self, segments: List[str], target_day: int, recurring_pattern: Optional[Dict]) -> List[Activity]:
+        """Parse activity segments hasil lexer"""
         activities = []
         
-        # Clean sentence dari common filler words
-        filler_words = ['hari', 'ini', 'saya', 'mau', 'aku', 'ingin', 'yang', 'dan', 'dengan', 'akan', 'ingin']
-        clean_sentence = sentence
-        for word in filler_words:
-            clean_sentence = re.sub(r'\b' + word + r'\b', '', clean_sentence)
-        
-        # Split by commas, "dan", "serta"
-        activity_strings = re.split(r'[,\.]|\bdan\b|\bserta\b', clean_sentence)
-        
-        for activity_str in activity_strings:
+        for activity_str in segments:
             activity_str = activity_str.strip()
             if not activity_str or len(activity_str) < 3:
                 continue
@@ -555,18 +2587,18 @@ class UltimateScheduler:
             # Enhanced pattern matching
             activity_data = self.parse_single_activity(activity_str)
             if activity_data:
-                activity_data['target_day'] = target_day
+                activity_data.target_day = target_day
                 if recurring_pattern:
-                    activity_data['recurring'] = recurring_pattern
+                    activity_data.recurring = recurring_pattern
                 activities.append(activity_data)
-                print(f"   ✅ Parsed: {activity_data['name']} - {activity_data['hours']}h x {activity_data['sessions']}s")
+                logger.debug("Parsed: %s - %sh x %ss", activity_data.name, activity_data.hours, activity_data.sessions)
         
         # Sort by priority
-        activities.sort(key=lambda x: self.priority_weights.get(x.get('priority', 'medium'), 1), reverse=True)
+        activities.sort(key=lambda x: self.priority_weights.get(x.priority, 1), reverse=True)
         
         return activities
     
-    def parse_single_activity(self, activity_str: str) -> Optional[Dict]:
+    def parse_single_activity(self, activity_str: str) -> Optional[Activity]:
         """Improved duration parsing"""
         # Pattern: "activity X jam"
         pattern = r'^(.+?)\s+(\d+)\s*jam\s*(?:(\d+)\s*sesi)?$'
@@ -603,70 +2635,77 @@ class UltimateScheduler:
         
         return None
     
-    def build_activity_data(self, name: str, hours: int, sessions: int) -> Dict:
+    def build_activity_data(self, name: str, hours: int, sessions: int) -> Activity:
         """Build activity data dengan template application"""
         activity_data = self.apply_activity_template(name.strip(), hours, sessions, 0)
         return activity_data
 
-    def apply_activity_template(self, activity_name: str, hours: int, sessions: int, target_day: int) -> Dict:
+    def apply_activity_template(self, activity_name: str, hours: int, sessions: int, target_day: int) -> Activity:
         """Apply smart templates dengan priority"""
-        activity_lower = activity_name.lower()
-        
-        for template_name, template in self.activity_templates.items():
-            if template_name in activity_lower:
-                return {
-                    'name': activity_name,
-                    'hours': template['duration'],
-                    'sessions': sessions,
-                    'priority': template['priority'],
-                    'type': 'templated',
-                    'target_day': target_day,
-                    'fixed_times': template.get('fixed_times'),
-                    'preferred_time': template.get('preferred_time'),
-                    'flexible': template.get('flexible', False)
-                }
+        hits = self.keyword_hits(activity_name)
+        
+        template_name = self.first_hit(hits, 'template')
+        if template_name:
+            template = self.activity_templates[template_name]
+            return Activity(
+                name=activity_name,
+                hours=template['duration'],
+                sessions=sessions,
+                priority=template['priority'],
+                type='templated',
+                target_day=target_day,
+                flexible=template.get('flexible', False),
+                fixed_times=template.get('fixed_times'),
+                preferred_time=template.get('preferred_time')
+            )
         
         # Default activity - guess priority from name
-        priority = 'medium'
-        if any(word in activity_lower for word in ['belajar', 'kerja', 'meeting', 'project', 'ai', 'coding']):
-            priority = 'high'
-        elif any(word in activity_lower for word in ['main', 'hiburan', 'social', 'game', 'nonton']):
-            priority = 'low'
-        
-        return {
-            'name': activity_name,
-            'hours': hours,
-            'sessions': sessions,
-            'priority': priority,
-            'type': 'regular',
-            'target_day': target_day,
-            'flexible': True
-        }
+        priority = self.first_hit(hits, 'priority') or 'medium'
+        
+        return Activity(
+            name=activity_name,
+            hours=hours,
+            sessions=sessions,
+            priority=priority,
+            type='regular',
+            target_day=target_day,
+            flexible=True
+        )
+    
+    RECURRENCE_HORIZON_DAYS = 7
     
-    def handle_recurring_events(self, activities: List[Dict], recurring_pattern: Dict, days_ahead: int = 7) -> List[Dict]:
-        """Generate recurring events untuk beberapa hari ke depan"""
+    def handle_recurring_events(self, activities: List[Activity], recurring_pattern: Dict, days_ahead: int = 7,
+                                reference_date: Optional[date] = None) -> List[Activity]:
+        """Generate recurring events untuk beberapa hari ke depan (materialized; pipeline memakai recurring_day_plans)"""
         if not recurring_pattern:
             return activities
-            
-        print(f"🔄 Generating recurring events for {days_ahead} days...")
-        
-        all_recurring_events = []
         
-        for day_offset in range(days_ahead):
-            target_date = datetime.now().date() + timedelta(days=day_offset)
-            
-            # Check jika hari ini sesuai dengan pattern
-            if self.should_schedule_today(target_date, recurring_pattern):
-                for activity in activities:
-                    if activity.get('recurring'):
-                        # Create copy untuk hari ini
-                        recurring_activity = activity.copy()
-                        recurring_activity['target_day'] = day_offset
-                        recurring_activity['recurring_instance'] = True
-                        recurring_activity['original_activity'] = activity['name']
-                        all_recurring_events.append(recurring_activity)
-        
-        return all_recurring_events
+        reference_date = reference_date or self.today()
+        recurrence = Recurrence.from_pattern(recurring_pattern, reference_date)
+        return [activity
+                for _, day_activities in self.recurring_day_plans(activities, recurrence, reference_date, days_ahead)
+                for activity in day_activities]
+    
+    def recurring_day_plans(self, activities: List[Activity], recurrence: Optional[Recurrence], reference_date: date,
+                            horizon_days: int) -> Iterator[Tuple[int, List[Activity]]]:
+        """Lazy (day_offset, activity instances) per occurrence di horizon; copy dibuat hanya untuk hari yang sedang dijadwalkan"""
+        if recurrence is None:
+            return
+        
+        logger.debug("Generating recurring events for %d days (%s)", horizon_days, recurrence)
+        recurring = [activity for activity in activities if activity.recurring]
+        
+        for occurrence in recurrence.occurrences(reference_date, reference_date + timedelta(days=horizon_days)):
+            day_offset = (occurrence - reference_date).days
+            day_activities = []
+            for activity in recurring:
+                # Create copy untuk hari ini
+                recurring_activity = activity.copy()
+                recurring_activity.target_day = day_offset
+                recurring_activity.recurring_instance = True
+                recurring_activity.original_activity = activity.name
+                day_activities.append(recurring_activity)
+            yield day_offset, day_activities
     
     def should_schedule_today(self, date: datetime.date, pattern: Dict) -> bool:
         """Check jika hari tertentu sesuai dengan recurring pattern"""
@@ -677,12 +2716,19 @@ class UltimateScheduler:
             return day_name in pattern.get('days', [])
         return False
 
-    def smart_schedule_with_conflict_resolution(self, activities: List[Dict], target_day: int = 0) -> Dict:
-        """Smart scheduling dengan conflict resolution"""
-        print("🎯 Smart Scheduling with Conflict Resolution...")
+    def smart_schedule_with_conflict_resolution(self, activities: List[Activity], target_day: int = 0,
+                                                day_plans: Optional[Iterator[Tuple[int, List[Activity]]]] = None,
+                                                placement: Optional[PlacementOptions] = None) -> Dict:
+        """Smart scheduling dengan conflict resolution (day_plans: lazy per-day input, mis. recurring;
+        placement: pakai optimal placement engine, None = greedy packer)"""
+        logger.debug("Smart scheduling with conflict resolution")
         
         # Generate initial schedule
-        schedule = self.smart_schedule(activities, target_day)
+        report = {'timed_out': False}
+        if day_plans is not None:
+            schedule = self.smart_schedule_days(day_plans, placement, report)
+        else:
+            schedule = self.smart_schedule(activities, target_day, placement, report)
         
         # Check for conflicts
         conflicts = self.detect_schedule_conflicts(schedule)
@@ -691,235 +2737,286 @@ class UltimateScheduler:
         suggestions = []
         
         if conflicts:
-            print(f"⚠️  Found {len(conflicts)} conflicts, attempting resolution...")
+            logger.debug("Found %d conflicts, attempting resolution", len(conflicts))
             resolved_schedule, suggestions = self.resolve_conflicts(schedule, conflicts)
         
         return {
             'schedule': resolved_schedule,
             'conflicts_detected': len(conflicts),
             'suggestions': suggestions,
-            'original_schedule': schedule
+            'original_schedule': schedule,
+            'placement_timed_out': report['timed_out']
         }
     
-    def detect_schedule_conflicts(self, schedule: List[Dict]) -> List[Dict]:
-        """Detect time conflicts dalam schedule"""
-        conflicts = []
-        
-        for i in range(len(schedule)):
-            for j in range(i + 1, len(schedule)):
-                event1 = schedule[i]
-                event2 = schedule[j]
-                
-                if self.events_overlap(event1, event2):
-                    conflicts.append({
-                        'event1': event1,
-                        'event2': event2,
-                        'type': 'time_overlap'
-                    })
-        
-        return conflicts
+    def detect_schedule_conflicts(self, schedule: List[Event]) -> List[Dict]:
+        """Detect time conflicts dalam schedule (sort & sweep, O(n log n + k))"""
+        intervals = sorted((event.start_min, event.end_min, index) for index, event in enumerate(schedule))
+        
+        active = []
+        pairs = []
+        
+        for start, end, index in intervals:
+            # Buang events yang sudah selesai sebelum event ini mulai
+            active = [item for item in active if item[1] > start]
+            for other_start, _, other_index in active:
+                if other_start < end:
+                    pairs.append((min(index, other_index), max(index, other_index)))
+            active.append((start, end, index))
+        
+        # Urutan sama dengan pair loop lama (i < j sesuai posisi di schedule)
+        pairs.sort()
+        
+        return [{
+            'event1': schedule[i],
+            'event2': schedule[j],
+            'type': 'time_overlap'
+        } for i, j in pairs]
     
-    def events_overlap(self, event1: Dict, event2: Dict) -> bool:
+    def events_overlap(self, event1: Event, event2: Event) -> bool:
         """Check jika dua events overlap waktu"""
-        start1 = datetime.fromisoformat(event1['start'])
-        end1 = datetime.fromisoformat(event1['end'])
-        start2 = datetime.fromisoformat(event2['start'])
-        end2 = datetime.fromisoformat(event2['end'])
-        
-        return not (end1 <= start2 or start1 >= end2)
+        return not (event1.end_min <= event2.start_min or event1.start_min >= event2.end_min)
     
-    def resolve_conflicts(self, schedule: List[Dict], conflicts: List[Dict]) -> Tuple[List[Dict], List[str]]:
-        """Resolve conflicts dengan smart suggestions"""
-        resolved_schedule = schedule.copy()
+    def resolve_conflicts(self, schedule: List[Event], conflicts: List[Dict]) -> Tuple[List[Event], List[str]]:
+        """Resolve conflicts dengan smart suggestions. Gap index dibangun sekali dan di-update per hari: slot baru
+        langsung terpakai, slot lama dikembalikan; event yang sudah dipindah (atau conflict yang sudah hilang)
+        tidak dipindah lagi"""
+        gaps = self.build_gap_index(schedule)
+        moved = {}
         suggestions = []
         
         for conflict in conflicts:
             event1, event2 = conflict['event1'], conflict['event2']
+            if event1 in moved or not self.events_overlap(event1, moved.get(event2, event2)):
+                continue
             
-            # Generate alternative time slots
-            alternatives = self.find_alternative_slots(event1, resolved_schedule)
+            # Alternative time slot terbaik (pagi dulu di hari yang sama)
+            alternatives = self.find_alternative_slots(event1, schedule, gaps, limit=1)
             
             if alternatives:
                 # Apply first alternative
                 best_alternative = alternatives[0]
-                resolved_schedule = self.move_event_to_slot(resolved_schedule, event1, best_alternative)
+                gaps.occupy(best_alternative['start_min'], best_alternative['end_min'])
+                gaps.release(event1.start_min, event1.end_min)
+                moved_event = event1.copy()
+                moved_event.start_min = best_alternative['start_min']
+                moved_event.end_min = best_alternative['end_min']
+                moved_event.conflict_resolved = True
+                moved[event1] = moved_event
                 
                 suggestions.append(
-                    f"📅 Moved '{event1['name']}' to {best_alternative['start_time'].strftime('%H:%M')} "
-                    f"karena bentrok dengan '{event2['name']}'"
+                    f"📅 Moved '{event1.name}' to {self.clock_str(best_alternative['start_min'])} "
+                    f"karena bentrok dengan '{event2.name}'"
                 )
             else:
                 suggestions.append(
-                    f"⚠️  Conflict: '{event1['name']}' bentrok dengan '{event2['name']}'. "
+                    f"⚠️  Conflict: '{event1.name}' bentrok dengan '{event2.name}'. "
                     f"Consider rescheduling manually."
                 )
         
+        resolved_schedule = [moved.get(event, event) for event in schedule]
+        resolved_schedule.sort(key=lambda x: x.start_min)
         return resolved_schedule, suggestions
     
-    def find_alternative_slots(self, event: Dict, schedule: List[Dict]) -> List[Dict]:
-        """Cari alternative time slots untuk event"""
-        event_duration = event['hours']
+    def build_gap_index(self, schedule: List[Event]) -> GapIndex:
+        """Gaps di antara events, per hari dalam PLACEMENT_HOURS"""
+        return GapIndex((event.start_min, event.end_min) for event in schedule)
+    
+    def find_alternative_slots(self, event: Event, schedule: List[Event], gaps: Optional[GapIndex] = None,
+                               limit: Optional[int] = None) -> List[Dict]:
+        """Cari alternative time slots untuk event: gaps di hari yang sama yang cukup panjang, pagi dulu"""
+        gaps = gaps or self.build_gap_index(schedule)
+        event_duration = self.to_minutes(event.hours)
+        day = event.start_min // MINUTES_PER_DAY
+        day_end = (day + 1) * MINUTES_PER_DAY
         alternatives = []
         
-        # Cari gaps dalam schedule
-        for i in range(len(schedule) - 1):
-            current_end = datetime.fromisoformat(schedule[i]['end'])
-            next_start = datetime.fromisoformat(schedule[i+1]['start'])
-            gap_hours = (next_start - current_end).seconds / 3600
-            
-            if gap_hours >= event_duration:
-                alternatives.append({
-                    'start_time': current_end,
-                    'end_time': current_end + timedelta(hours=event_duration),
-                    'gap_hours': gap_hours,
-                    'reason': 'Available gap'
-                })
-        
-        # Sort by optimal timing (prioritize morning slots)
-        alternatives.sort(key=lambda x: x['start_time'].hour)
+        for start, end in gaps.fits(day, event_duration):
+            if start + event_duration > day_end:
+                break
+            alternatives.append({
+                'start_min': start,
+                'end_min': start + event_duration,
+                'gap_hours': (end - start) / 60,
+                'reason': 'Available gap'
+            })
+            if limit and len(alternatives) >= limit:
+                break
         
         return alternatives
-    
-    def move_event_to_slot(self, schedule: List[Dict], event: Dict, new_slot: Dict) -> List[Dict]:
-        """Pindahkan event ke slot baru"""
-        # Remove event dari schedule lama
-        new_schedule = [e for e in schedule if e != event]
-        
-        # Create event baru dengan waktu baru
-        moved_event = event.copy()
-        moved_event['start'] = new_slot['start_time'].isoformat()
-        moved_event['end'] = new_slot['end_time'].isoformat()
-        moved_event['conflict_resolved'] = True
-        
-        # Add ke schedule baru
-        new_schedule.append(moved_event)
-        
-        # Sort kembali
-        new_schedule.sort(key=lambda x: x['start'])
-        
-        return new_schedule
 
-    def smart_schedule(self, activities: List[Dict], target_day: int = 0) -> List[Dict]:
+    def smart_schedule(self, activities: List[Activity], target_day: int = 0,
+                       placement: Optional[PlacementOptions] = None, report: Optional[Dict] = None) -> List[Event]:
         """SMART SCHEDULING dengan priority-based multi-day"""
-        print("🎯 Generating Priority-Based Multi-Day Schedule...")
+        logger.debug("Generating priority-based multi-day schedule")
         
         schedules_by_day = {}
         
         # Group activities by day
         for activity in activities:
-            day = activity['target_day']
+            day = activity.target_day
             if day not in schedules_by_day:
                 schedules_by_day[day] = []
             schedules_by_day[day].append(activity)
         
-        # Generate schedule untuk setiap day
+        return self.smart_schedule_days(schedules_by_day.items(), placement, report)
+    
+    def smart_schedule_days(self, day_plans, placement: Optional[PlacementOptions] = None,
+                            report: Optional[Dict] = None) -> List[Event]:
+        """Jadwalkan (day_offset, activities) satu hari per iterasi; day_plans boleh generator.
+        Plan dengan >= parallel_day_threshold hari dikerjakan di day pool (kalau day_workers > 0).
+        report['timed_out'] di-set kalau ada placement search yang berhenti di deadline"""
+        day_plans = iter(day_plans)
         final_schedule = []
         
-        for day_offset, day_activities in schedules_by_day.items():
-            print(f"📅 Processing day +{day_offset}")
+        if self.day_workers > 0:
+            head = list(islice(day_plans, self.parallel_day_threshold))
+            if len(head) >= self.parallel_day_threshold:
+                final_schedule = self.schedule_days_parallel(chain(head, day_plans), placement, report)
+                day_plans = iter(())
+            else:
+                day_plans = iter(head)
+        
+        for day_offset, day_activities in day_plans:
+            logger.debug("Processing day +%d", day_offset)
             
             # Sort activities by priority untuk day ini
-            day_activities.sort(key=lambda x: self.priority_weights.get(x.get('priority', 'medium'), 1), reverse=True)
+            day_activities.sort(key=lambda x: self.priority_weights.get(x.priority, 1), reverse=True)
             
-            day_schedule = self.schedule_single_day(day_activities, day_offset)
+            day_schedule = self.schedule_single_day(day_activities, day_offset, placement, report)
             final_schedule.extend(day_schedule)
         
-        # Sort seluruh schedule by datetime
-        final_schedule.sort(key=lambda x: x['start'])
+        # Sort seluruh schedule by waktu mulai
+        final_schedule.sort(key=lambda x: x.start_min)
         
         return final_schedule
     
-    def schedule_single_day(self, activities: List[Dict], day_offset: int) -> List[Dict]:
-        """Generate schedule untuk single day dengan priority"""
-        schedule = []
-        current_date = datetime.now().date() + timedelta(days=day_offset)
-        
-        # Pisahkan fixed vs flexible
-        fixed_activities = [a for a in activities if a.get('fixed_times')]
-        flexible_activities = [a for a in activities if not a.get('fixed_times')]
-        
-        # Process fixed activities first
-        daily_schedule = {}
-        
-        for activity in fixed_activities:
-            for time_str in activity['fixed_times']:
-                fixed_time = datetime.strptime(time_str, "%H:%M").time()
-                event_time = datetime.combine(current_date, fixed_time)
-                
-                event = {
-                    'name': activity['name'],
-                    'start': event_time.isoformat(),
-                    'end': (event_time + timedelta(hours=activity['hours'])).isoformat(),
-                    'session': 1,
-                    'total_sessions': 1,
-                    'type': 'fixed',
-                    'priority': activity['priority'],
-                    'day_offset': day_offset,
-                    'hours': activity['hours']
-                }
-                
-                key = event_time.strftime("%H:%M")
-                daily_schedule[key] = event
-        
-        # Process flexible activities by priority
-        current_time = datetime.combine(current_date, datetime.strptime("09:00", "%H:%M").time())
+    DAY_CHUNK_SIZE = 32
+    
+    def schedule_days_parallel(self, day_plans, placement: Optional[PlacementOptions] = None,
+                               report: Optional[Dict] = None) -> List[Event]:
+        """Fan-out per chunk hari ke day pool, hasil digabung sesuai urutan submit.
+        In-flight chunk dibatasi supaya generator day_plans tetap dikonsumsi bertahap"""
+        pool = self.get_day_pool()
+        pending = deque()
+        final_schedule = []
         
-        for activity in flexible_activities:
-            # Skip conflicts
-            while any(self.is_time_conflict(current_time, activity['hours'], fixed_event) 
-                     for fixed_event in daily_schedule.values()):
-                current_time += timedelta(hours=activity['hours'] + 0.25)
-            
-            for session in range(activity['sessions']):
-                end_time = current_time + timedelta(hours=activity['hours'])
-                
-                event = {
-                    'name': activity['name'],
-                    'start': current_time.isoformat(),
-                    'end': end_time.isoformat(),
-                    'session': session + 1,
-                    'total_sessions': activity['sessions'],
-                    'type': 'flexible',
-                    'priority': activity['priority'],
-                    'day_offset': day_offset,
-                    'hours': activity['hours']
-                }
-                
-                schedule.append(event)
-                
-                # Break between sessions
-                if session < activity['sessions'] - 1:
-                    break_time = end_time + timedelta(minutes=15)
-                    schedule.append({
-                        'name': "BREAK",
-                        'start': end_time.isoformat(),
-                        'end': break_time.isoformat(),
-                        'session': '-',
-                        'total_sessions': '-',
-                        'type': 'break',
-                        'priority': 'low',
-                        'day_offset': day_offset,
-                        'hours': 0.25
-                    })
-                    current_time = break_time
-                else:
-                    current_time = end_time
+        while True:
+            chunk = list(islice(day_plans, self.DAY_CHUNK_SIZE))
+            if not chunk:
+                break
+            for _, day_activities in chunk:
+                day_activities.sort(key=lambda x: self.priority_weights.get(x.priority, 1), reverse=True)
+            pending.append(pool.submit(schedule_days, chunk, placement))
+            if len(pending) >= self.day_workers * 2:
+                self.collect_days(pending.popleft(), final_schedule, report)
         
-        # Combine schedules
-        day_final = list(daily_schedule.values()) + schedule
-        day_final.sort(key=lambda x: x['start'])
+        while pending:
+            self.collect_days(pending.popleft(), final_schedule, report)
         
-        return day_final
+        logger.debug("Parallel day scheduling: %d events", len(final_schedule))
+        return final_schedule
+    
+    def collect_days(self, future, final_schedule: List[Event], report: Optional[Dict]):
+        events, timed_out = future.result()
+        final_schedule.extend(events)
+        if timed_out and report is not None:
+            report['timed_out'] = True
+    
+    def get_day_pool(self) -> ProcessPoolExecutor:
+        with self.day_pool_lock:
+            if self.day_pool is None:
+                # spawn: aman dipakai dari process yang sudah punya thread (API worker pool, history writer)
+                self.day_pool = ProcessPoolExecutor(max_workers=self.day_workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            return self.day_pool
+    
+    def schedule_single_day(self, activities: List[Activity], day_offset: int,
+                            placement: Optional[PlacementOptions] = None, report: Optional[Dict] = None) -> List[Event]:
+        """Generate schedule untuk single day dengan priority"""
+        return plan_day(activities, day_offset, placement, report)
+    
+    def preferred_windows(self, time_context: TimeContext) -> List[Tuple[int, int]]:
+        """Range 'jam X-Y' -> (start, end) menit dalam hari; 'jam 2-4' dibaca siang (14-16)"""
+        windows = []
+        for time_range in time_context.preferred_times:
+            start, end = time_range['start'], time_range['end']
+            if end <= 6:
+                start, end = start + 12, end + 12
+            if start < end <= 24:
+                windows.append((start * 60, end * 60))
+        return windows
     
-    def is_time_conflict(self, start_time: datetime, duration: float, existing_event: Dict) -> bool:
+    def placement_options(self, time_context: TimeContext, day_count: int,
+                          budget_ms: Optional[int] = None) -> Optional[PlacementOptions]:
+        """Budget per request dibagi rata ke tiap hari, jadi total search time tetap di bawah budget"""
+        budget_ms = self.placement_budget_ms if budget_ms is None else budget_ms
+        if budget_ms <= 0:
+            return None
+        return PlacementOptions(self.preferred_windows(time_context), budget_ms / 1000 / max(day_count, 1))
+    
+    def is_time_conflict(self, start_min: int, duration_min: int, existing_event: Event) -> bool:
         """Check time conflict"""
-        event_start = datetime.fromisoformat(existing_event['start'])
-        event_end = datetime.fromisoformat(existing_event['end'])
-        proposed_end = start_time + timedelta(hours=duration)
+        proposed_end = start_min + duration_min
+        
+        return not (proposed_end <= existing_event.start_min or start_min >= existing_event.end_min)
+    
+    def to_minutes(self, hours: float) -> int:
+        """Durasi jam -> menit (integer timeline)"""
+        return to_minutes(hours)
+    
+    def clock_minutes(self, time_str: str) -> int:
+        """'HH:MM' -> menit sejak tengah malam"""
+        return clock_minutes(time_str)
+    
+    def clock_str(self, minute: int) -> str:
+        """Menit timeline -> 'HH:MM'"""
+        return f"{minute % MINUTES_PER_DAY // 60:02d}:{minute % 60:02d}"
+    
+    def today(self, tz: Optional[str] = None) -> date:
+        """Tanggal sekarang menurut clock, di timezone tz (default: timezone scheduler)"""
+        zone = ZoneInfo(tz) if tz else self.tz
+        now = self.clock()
+        return (now.astimezone(zone) if zone else now).date()
+    
+    def utc_timestamp(self) -> str:
+        """Clock -> UTC 'YYYY-MM-DD HH:MM:SS' (format sama dengan SQLite CURRENT_TIMESTAMP)"""
+        return self.clock().astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def timeline_origin(self, reference_date: Optional[date] = None) -> datetime:
+        """Awal horizon (menit 0) = tengah malam reference date (default: hari ini)"""
+        return datetime.combine(reference_date or self.today(), time.min)
+    
+    def serialize_schedule(self, schedule: List[Event], origin: Optional[datetime] = None) -> List[Dict]:
+        """Integer timeline -> ISO events (hanya di API / storage boundary)"""
+        origin = origin or self.timeline_origin()
+        day_prefixes = {}
+        serialized = []
+        
+        def iso(minute: int) -> str:
+            day = minute // MINUTES_PER_DAY
+            if day not in day_prefixes:
+                day_prefixes[day] = (origin + timedelta(days=day)).date().isoformat()
+            return f"{day_prefixes[day]}T{self.clock_str(minute)}:00"
+        
+        for event in schedule:
+            serialized_event = {
+                'name': event.name,
+                'start': iso(event.start_min),
+                'end': iso(event.end_min),
+                'session': event.session,
+                'total_sessions': event.total_sessions,
+                'type': event.type,
+                'priority': event.priority,
+                'day_offset': event.day_offset,
+                'hours': event.hours
+            }
+            if event.conflict_resolved:
+                serialized_event['conflict_resolved'] = True
+            serialized.append(serialized_event)
         
-        return not (proposed_end <= event_start or start_time >= event_end)
+        return serialized
     
-    def calculate_productivity_score(self, schedule: List[Dict]) -> Dict:
+    def calculate_productivity_score(self, schedule: List[Event]) -> Dict:
         """Hitung productivity metrics dengan priority weighting"""
         productive_hours = 0
         break_hours = 0
@@ -927,17 +3024,15 @@ class UltimateScheduler:
         
         for event in schedule:
             # Calculate duration from start and end times
-            start_dt = datetime.fromisoformat(event['start'])
-            end_dt = datetime.fromisoformat(event['end'])
-            duration = (end_dt - start_dt).seconds / 3600  # Convert to hours
+            duration = (event.end_min - event.start_min) / 60  # Convert to hours
             
-            if event['name'] == 'BREAK':
+            if event.name == 'BREAK':
                 break_hours += duration
             else:
                 productive_hours += duration
                 # Get hours from event data or use duration as fallback
-                event_hours = event.get('hours', duration)
-                priority_weight = self.priority_weights.get(event.get('priority', 'medium'), 1)
+                event_hours = event.hours
+                priority_weight = self.priority_weights.get(event.priority, 1)
                 priority_score += event_hours * priority_weight
         
         total_weighted_hours = productive_hours * 3  # Max possible score
@@ -952,39 +3047,38 @@ class UltimateScheduler:
             'priority_efficiency': priority_score / total_weighted_hours if total_weighted_hours > 0 else 0
         }
     
-    def display_schedule(self, schedule: List[Dict], metrics: Dict):
-        """Display schedule dengan multi-day support"""
+    def display_schedule(self, schedule: List[Event], metrics: Dict, reference_date: Optional[date] = None):
+        """Display schedule dengan multi-day support (hari ke-0 = reference_date, default hari ini)"""
         print("\n" + "🎊" * 50)
         print("🎯 ULTIMATE SCHEDULE - MULTI-DAY & PRIORITY AWARE!")
         print("🎊" * 50)
         
         current_day = None
+        origin = self.timeline_origin(reference_date)
         
         for event in schedule:
-            start_dt = datetime.fromisoformat(event['start'])
-            end_dt = datetime.fromisoformat(event['end'])
-            
-            day_str = start_dt.strftime("%A, %d %B %Y")
-            if day_str != current_day:
-                current_day = day_str
+            day = event.start_min // MINUTES_PER_DAY
+            if day != current_day:
+                current_day = day
+                day_str = (origin + timedelta(days=day)).strftime("%A, %d %B %Y")
                 print(f"\n📅 {day_str}")
                 print("   " + "─" * 40)
             
-            start_str = start_dt.strftime("%H:%M")
-            end_str = end_dt.strftime("%H:%M")
+            start_str = self.clock_str(event.start_min)
+            end_str = self.clock_str(event.end_min)
             
             # Priority emoji
             priority_emoji = {
                 'high': '🔥',
                 'medium': '✅', 
                 'low': '⚡'
-            }.get(event.get('priority', 'medium'), '✅')
+            }.get(event.priority, '✅')
             
-            if event['name'] == "BREAK":
+            if event.name == "BREAK":
                 print(f"   ☕ {start_str} - {end_str} | BREAK TIME")
             else:
-                session_info = f"(Sesi {event['session']}/{event['total_sessions']})" if event['total_sessions'] > 1 else ""
-                print(f"   {priority_emoji} {start_str} - {end_str} | {event['name'].title()} {session_info}")
+                session_info = f"(Sesi {event.session}/{event.total_sessions})" if event.total_sessions > 1 else ""
+                print(f"   {priority_emoji} {start_str} - {end_str} | {event.name.title()} {session_info}")
         
         print(f"\n📊 PRODUCTIVITY ANALYTICS:")
         print(f"   🎯 Productive Hours: {metrics['productive_hours']:.1f} jam")
@@ -993,7 +3087,7 @@ class UltimateScheduler:
         print(f"   🔥 Priority Score: {metrics['priority_score']:.1f}/{metrics['max_priority_score']:.1f}")
         print(f"   🚀 Priority Efficiency: {metrics['priority_efficiency']:.1%}")
     
-    def enhanced_display_schedule(self, schedule: List[Dict], metrics: Dict, conflicts: int, suggestions: List[str]):
+    def enhanced_display_schedule(self, schedule: List[Event], metrics: Dict, conflicts: int, suggestions: List[str]):
         """Enhanced display dengan conflict information"""
         self.display_schedule(schedule, metrics)
         
@@ -1029,7 +3123,7 @@ class UltimateScheduler:
     
     def ultimate_blitz_mode(self, sentence: str):
         """ULTIMATE FUNCTION dengan semua enhancements"""
-        print("🚀 ULTIMATE BLITZ MODE ACTIVATED!")
+        logger.debug("Ultimate blitz mode: %r", sentence)
         
         try:
             # Step 1: Advanced Parsing dengan recurring detection
@@ -1050,10 +3144,12 @@ class UltimateScheduler:
             metrics = self.calculate_productivity_score(schedule)
             
             # Step 5: Enhanced Display dengan conflict info
-            self.enhanced_display_schedule(schedule, metrics, conflicts, suggestions)
+            if not self.headless:
+                self.enhanced_display_schedule(schedule, metrics, conflicts, suggestions)
             
-            # Step 6: Save to History
-            self.save_schedule_history(sentence, schedule, metrics)
+            # Step 6: Save to History (ISO events)
+            schedule = self.serialize_schedule(schedule)
+            self.record_history(sentence, schedule, metrics)
             
             return {
                 'schedule': schedule,
@@ -1063,70 +3159,174 @@ class UltimateScheduler:
             }
             
         except Exception as e:
-            print(f"❌ ERROR in ultimate_blitz_mode: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("ERROR in ultimate_blitz_mode: %s", e)
             return {}
         
-    def ultimate_enhanced_blitz_mode(self, sentence: str):
-        """ULTIMATE FUNCTION dengan enhanced NLP & smart suggestions"""
-        print("🚀 ULTIMATE ENHANCED BLITZ MODE ACTIVATED!")
+    def ultimate_enhanced_blitz_mode(self, sentence: str, reference_date: Optional[date] = None, use_cache: bool = True,
+                                     tz: Optional[str] = None, horizon_days: int = RECURRENCE_HORIZON_DAYS,
+                                     placement_budget_ms: Optional[int] = None):
+        """ULTIMATE FUNCTION dengan enhanced NLP & smart suggestions.
+        reference_date = hari ke-0 jadwal (default: hari ini di timezone tz / timezone scheduler)
+        placement_budget_ms = time budget optimal placement engine (None = default scheduler, 0 = greedy)"""
+        logger.debug("Ultimate enhanced blitz mode: %r", sentence)
         
         try:
-            # Step 1: Context-aware parsing
-            activities, target_day, recurring_pattern, time_context = self.context_aware_parse(sentence)
-            
-            # Step 2: Handle recurring events jika ada
-            if recurring_pattern:
-                activities = self.handle_recurring_events(activities, recurring_pattern)
-            
-            # Step 3: Smart Scheduling dengan Conflict Resolution
-            scheduling_result = self.smart_schedule_with_conflict_resolution(activities, target_day)
-            
-            schedule = scheduling_result['schedule']
-            conflicts = scheduling_result['conflicts_detected']
-            conflict_suggestions = scheduling_result['suggestions']
+            reference_date = reference_date or self.today(tz)
+            if placement_budget_ms is None:
+                placement_budget_ms = self.placement_budget_ms
+            options = {'horizon_days': horizon_days, 'placement_budget_ms': placement_budget_ms}
             
-            # Step 4: Generate Smart Suggestions
-            smart_suggestions = self.generate_smart_suggestions(schedule, activities, time_context)
+            # Repeated request: hasil yang sama tanpa recompute (cache hit tidak di-render ulang)
+            result = self.cached_result(sentence, reference_date, **options) if use_cache else None
             
-            # Step 5: Calculate Metrics
-            metrics = self.calculate_productivity_score(schedule)
-            
-            # Step 6: Enhanced Display dengan semua suggestions
-            self.ultimate_display_schedule(schedule, metrics, conflicts, conflict_suggestions, smart_suggestions, time_context)
+            if result is None:
+                # Step 1-5: Parsing, scheduling, suggestions & metrics
+                built = self.build_enhanced_schedule(sentence, reference_date, horizon_days, placement_budget_ms)
+                
+                # Step 6: Enhanced Display dengan semua suggestions
+                if not self.headless:
+                    self.ultimate_display_schedule(built['schedule'], built['metrics'], built['conflicts_resolved'],
+                                                   built['conflict_suggestions'], built['smart_suggestions'],
+                                                   built['time_context'], reference_date)
+                
+                result = self.serialize_result(built, reference_date)
+                if use_cache and self.cacheable(result):
+                    self.store_result(sentence, reference_date, result, **options)
             
-            # Step 7: Save to History
-            self.save_schedule_history(sentence, schedule, metrics)
+            # Step 7: Save to History (ISO events); schedule_id untuk GET/PATCH /schedule/{id}
+            result['schedule_id'] = self.record_history(sentence, result['schedule'], result['metrics'])
             
-            return {
-                'schedule': schedule,
-                'metrics': metrics,
-                'conflicts_resolved': conflicts,
-                'smart_suggestions': smart_suggestions,
-                'time_context': time_context
-            }
+            return result
             
         except Exception as e:
-            print(f"❌ ERROR in ultimate_enhanced_blitz_mode: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("ERROR in ultimate_enhanced_blitz_mode: %s", e)
             return {}
+    
+    def ultimate_enhanced_batch_mode(self, sentences: List[str], reference_date: Optional[date] = None,
+                                     use_cache: bool = True, tz: Optional[str] = None,
+                                     horizon_days: int = RECURRENCE_HORIZON_DAYS,
+                                     placement_budget_ms: Optional[int] = None) -> List[Dict]:
+        """Batch version: banyak sentences, satu transaction untuk history (juga lewat write-behind queue).
+        Sentence kosong / gagal jadi error per item dan tidak disimpan"""
+        logger.debug("Batch mode: %d sentences", len(sentences))
+        
+        reference_date = reference_date or self.today(tz)
+        if placement_budget_ms is None:
+            placement_budget_ms = self.placement_budget_ms
+        options = {'horizon_days': horizon_days, 'placement_budget_ms': placement_budget_ms}
+        results = []
+        history_entries = []
+        
+        for sentence in sentences:
+            if not sentence.strip():
+                results.append({'success': False, 'error': 'Sentence cannot be empty'})
+                continue
+            result = self.cached_result(sentence, reference_date, **options) if use_cache else None
+            if result is None:
+                try:
+                    built = self.build_enhanced_schedule(sentence, reference_date, horizon_days, placement_budget_ms)
+                    result = self.serialize_result(built, reference_date)
+                except Exception as e:
+                    logger.warning("Batch item failed: %r: %s", sentence, e)
+                    results.append({'success': False, 'error': str(e)})
+                    continue
+                if use_cache and self.cacheable(result):
+                    self.store_result(sentence, reference_date, result, **options)
+            
+            results.append({'success': True, **result})
+            history_entries.append((sentence, result['schedule'], result['metrics']))
+        
+        uids = iter(self.record_history_batch(history_entries))
+        for result in results:
+            if result['success']:
+                result['schedule_id'] = next(uids)
+        
+        return results
+    
+    def result_cache_key(self, sentence: str, reference_date: date, **options) -> Tuple:
+        """Pipeline deterministik untuk (normalized sentence, reference date, engine options)"""
+        return (self.normalize_sentence(sentence), reference_date.isoformat(), tuple(sorted(options.items())))
+    
+    def cached_result(self, sentence: str, reference_date: date, **options) -> Optional[Dict]:
+        if not self.result_cache:
+            return None
+        return self.result_cache.get(self.result_cache_key(sentence, reference_date, **options))
+    
+    def store_result(self, sentence: str, reference_date: date, result: Dict, **options):
+        if self.result_cache:
+            self.result_cache.put(self.result_cache_key(sentence, reference_date, **options), result)
+    
+    def build_enhanced_schedule(self, sentence: str, reference_date: Optional[date] = None,
+                                horizon_days: int = RECURRENCE_HORIZON_DAYS,
+                                placement_budget_ms: Optional[int] = None) -> Dict:
+        """Pipeline inti (parse -> schedule -> suggestions -> metrics) tanpa display & database.
+        Schedule masih berupa Event objects di integer-minute timeline, serialize_result() sebelum keluar dari engine."""
+        reference_date = reference_date or self.today()
+        
+        # Step 1: Context-aware parsing
+        activities, target_day, recurring_pattern, time_context = self.context_aware_parse(sentence)
+        
+        # Step 2: Recurring events jika ada, di-generate lazy per hari selama horizon
+        day_plans = None
+        day_count = len({activity.target_day for activity in activities})
+        if recurring_pattern:
+            recurrence = Recurrence.from_pattern(recurring_pattern, reference_date)
+            day_plans = self.recurring_day_plans(activities, recurrence, reference_date, horizon_days)
+            activities = [activity for activity in activities if activity.recurring]
+            horizon_end = reference_date + timedelta(days=horizon_days)
+            day_count = sum(1 for _ in recurrence.occurrences(reference_date, horizon_end)) if recurrence else 0
+        
+        # Step 3: Smart Scheduling dengan Conflict Resolution (greedy packer atau optimal placement engine)
+        placement = self.placement_options(time_context, day_count, placement_budget_ms)
+        scheduling_result = self.smart_schedule_with_conflict_resolution(activities, target_day, day_plans, placement)
+        
+        schedule = scheduling_result['schedule']
+        
+        # Step 4: Generate Smart Suggestions
+        smart_suggestions = self.generate_smart_suggestions(schedule, activities, time_context)
+        
+        # Step 5: Calculate Metrics
+        metrics = self.calculate_productivity_score(schedule)
+        
+        result = {
+            'schedule': schedule,
+            'metrics': metrics,
+            'conflicts_resolved': scheduling_result['conflicts_detected'],
+            'conflict_suggestions': scheduling_result['suggestions'],
+            'smart_suggestions': smart_suggestions,
+            'time_context': time_context
+        }
+        if placement:
+            # timed_out: placement tergantung kecepatan CPU, hasil tidak deterministik (tidak di-cache)
+            result['placement'] = {'engine': 'optimal', 'timed_out': scheduling_result['placement_timed_out']}
+        return result
+    
+    def cacheable(self, result: Dict) -> bool:
+        """Hanya hasil deterministik yang boleh di-cache / di-replay"""
+        return not result.get('placement', {}).get('timed_out')
 
-    def ultimate_display_schedule(self, schedule: List[Dict], metrics: Dict, conflicts: int, 
+    def serialize_result(self, result: Dict, reference_date: Optional[date] = None) -> Dict:
+        """Event / TimeContext objects -> plain dicts untuk response & storage"""
+        return {
+            **result,
+            'schedule': self.serialize_schedule(result['schedule'], self.timeline_origin(reference_date)),
+            'time_context': result['time_context'].to_dict()
+        }
+
+    def ultimate_display_schedule(self, schedule: List[Event], metrics: Dict, conflicts: int, 
                                 conflict_suggestions: List[str], smart_suggestions: List[str], 
-                                time_context: Dict):
+                                time_context: TimeContext, reference_date: Optional[date] = None):
         """Ultimate display dengan semua enhancements"""
-        self.display_schedule(schedule, metrics)
+        self.display_schedule(schedule, metrics, reference_date)
         
         # Display time context
-        if time_context['time_of_day']:
+        if time_context.time_of_day:
             print(f"\n⏰ TIME CONTEXT:")
-            print(f"   Preferred time: {time_context['time_of_day']}")
-            if time_context['flexibility']:
+            print(f"   Preferred time: {time_context.time_of_day}")
+            if time_context.flexibility:
                 print(f"   ⚡ Flexible scheduling available")
-            if time_context['urgency'] != 'normal':
-                print(f"   🚨 Urgency level: {time_context['urgency']}")
+            if time_context.urgency != 'normal':
+                print(f"   🚨 Urgency level: {time_context.urgency}")
         
         # Display conflict resolution
         if conflicts > 0:
@@ -1143,8 +3343,36 @@ class UltimateScheduler:
 
 # 🎪 TEST ULTIMATE VERSION
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Ultimate Scheduler demo & maintenance")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="Backfill analytics rollup tables dari history yang ada, lalu keluar")
+    parser.add_argument("--import-history", metavar="PATH",
+                        help="Bulk import history dari file NDJSON / CSV, lalu keluar")
+    parser.add_argument("--import-format", choices=["ndjson", "csv"],
+                        help="Format file import (default: dari extension file)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
     scheduler = UltimateScheduler()
     
+    if args.rebuild_rollups:
+        scheduler.rebuild_rollups()
+        scheduler.close()
+        raise SystemExit(0)
+    
+    if args.import_history:
+        import_format = args.import_format or ('csv' if args.import_history.endswith('.csv') else 'ndjson')
+        with open(args.import_history, newline='', encoding='utf-8') as import_file:
+            summary = scheduler.import_history(import_file, import_format)
+        scheduler.close()
+        print(json.dumps(summary, indent=2))
+        raise SystemExit(0 if not summary['failed'] else 1)
+    
+    # Demo: tampilkan trace parsing & scheduling (progress engine di level DEBUG)
+    logger.setLevel(logging.DEBUG)
+    
     # Test cases dengan fitur baru
     test_sentences = [
         "besok pagi meeting penting 2 jam, sore belajar AI 3 jam",
@@ -1156,8 +3384,8 @@ if __name__ == "__main__":
     print("🧪 ULTIMATE SCHEDULER WITH ENHANCEMENTS TESTING...")
     print("=" * 70)
     
-    # Test pertama
-    result = scheduler.ultimate_enhanced_blitz_mode(test_sentences)
+    for sentence in test_sentences:
+        scheduler.ultimate_enhanced_blitz_mode(sentence)
     
     # Show analytics
     scheduler.show_analytics_dashboard()
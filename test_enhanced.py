@@ -1,4 +1,11 @@
-from improved import UltimateScheduler
+import json
+import threading
+from datetime import date, datetime, timedelta, timezone
+from time import monotonic
+
+import pytest
+
+from improved import Activity, Event, HistoryWriter, Recurrence, UltimateScheduler, optimize_day
 
 def test_enhanced_features():
     scheduler = UltimateScheduler()
@@ -41,5 +48,647 @@ def test_enhanced_features():
     print('='*70)
     scheduler.show_analytics_dashboard()
 
+
+def test_single_pass_lexer(tmp_path):
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db")
+    
+    stream = scheduler.lexer.scan("setiap hari jumat meeting jam 9-11, belajar 2 jam serta baca buku")
+    
+    assert scheduler.recurring_pattern_from_stream(stream) == {'type': 'weekly', 'days': ['friday']}
+    assert stream.time_ranges() == [{'start': 9, 'end': 11}]
+    assert stream.segments({'recurring', 'filler'}) == ['meeting jam 9-11', 'belajar 2 jam', 'baca buku']
+
+
+def test_keyword_automaton_single_scan(tmp_path):
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db")
+    
+    hits = scheduler.keyword_hits("belajar kelompok coding")
+    
+    assert hits['category'] == {'learning', 'creative'}
+    assert scheduler.first_hit(hits, 'category') == 'learning'
+    assert scheduler.first_hit(hits, 'social') == 'medium'
+    assert scheduler.first_hit(hits, 'template') == 'belajar'
+
+
+def test_parse_cache_copy_on_read(tmp_path):
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", parse_cache_size=1)
+    
+    activities, _, _, _ = scheduler.context_aware_parse("besok meeting 2 jam, coding 3 jam")
+    activities[0].name = 'mutated'
+    cached, _, _, _ = scheduler.context_aware_parse("Besok  meeting 2 jam, coding 3 jam")
+    scheduler.context_aware_parse("lusa olahraga")
+    
+    assert cached[0].name != 'mutated'
+    stats = scheduler.parse_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 2, 1)
+
+PREVIEW_SENTENCE = "besok pagi meeting penting 2 jam, sore belajar AI 3 jam"
+
+def test_parse_preview_without_scheduling_or_history(tmp_path):
+    """Parse-only preview: activities, day reference, time context; tidak ada row baru di schedules"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    conn = scheduler.get_connection()
+    
+    preview = scheduler.parse_preview(PREVIEW_SENTENCE)
+    assert [(activity['name'], activity['category']) for activity in preview['activities']] == \
+        [('belajar ai', 'learning'), ('meeting', 'work')]
+    assert preview['total_hours'] == sum(a['hours'] * a['sessions'] for a in preview['activities'])
+    assert (preview['target_day'], preview['day_reference'], preview['recurring']) == (1, 'besok', None)
+    assert preview['time_context'] == {'time_of_day': 'morning', 'flexibility': False, 'urgency': 'high',
+                                       'preferred_times': []}
+    
+    weekly = scheduler.parse_preview("setiap senin olahraga sore 1 jam")
+    assert weekly['recurring'] == {'type': 'weekly', 'days': ['monday']} and weekly['day_reference'] == 'hari ini'
+    assert weekly['time_context']['time_of_day'] == 'evening'
+    assert conn.execute('SELECT COUNT(*) FROM schedules').fetchone()[0] == 0
+    scheduler.close()
+
+def test_parse_endpoint_preview_only(tmp_path, monkeypatch):
+    """POST /parse: response sama dengan parse_preview, tidak menulis history"""
+    testclient = pytest.importorskip("fastapi.testclient")
+    import app as api
+    monkeypatch.setattr(api, "create_scheduler",
+                        lambda: UltimateScheduler(db_path=tmp_path / "history.db", headless=True))
+    
+    with testclient.TestClient(api.app) as client:
+        body = client.post("/parse", json={'sentence': PREVIEW_SENTENCE}).json()
+        assert body['success'] and body['message'] == ''
+        assert {key: body[key] for key in api.scheduler.parse_preview(PREVIEW_SENTENCE)} == \
+            api.scheduler.parse_preview(PREVIEW_SENTENCE)
+        assert body['day_reference'] == 'besok' and body['time_context']['urgency'] == 'high'
+        assert api.scheduler.get_connection().execute('SELECT COUNT(*) FROM schedules').fetchone()[0] == 0
+
+def test_integer_timeline_crosses_midnight(tmp_path):
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db")
+    
+    event = Event('deploy', 23 * 60, 25 * 60, 1, 1, 'flexible', 'high', 0, 2)
+    metrics = scheduler.calculate_productivity_score([event])
+    serialized = scheduler.serialize_schedule([event])[0]
+    
+    assert metrics['productive_hours'] == 2
+    assert serialized['start'].endswith('T23:00:00') and serialized['end'].endswith('T01:00:00')
+    assert serialized['start'][:10] != serialized['end'][:10]
+
+def test_flexible_sessions_fill_gaps_between_fixed_blocks(tmp_path):
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db")
+    
+    activities = [
+        scheduler.apply_activity_template('sholat', 1, 1, 0),
+        scheduler.apply_activity_template('coding', 2, 3, 0)
+    ]
+    day = scheduler.schedule_single_day(activities, 0)
+    fixed = [e for e in day if e.type == 'fixed']
+    sessions = [e for e in day if e.type == 'flexible']
+    
+    assert [scheduler.clock_str(e.start_min) for e in sessions] == ['09:00', '13:30', '20:30']
+    assert not any(scheduler.events_overlap(a, b) for a in sessions for b in fixed)
+
+def test_conflict_sweep_matches_pairwise(tmp_path):
+    """Sort & sweep menghasilkan pasangan (dan urutan) yang sama dengan pairwise check"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+
+    def event(name, start, end, day=0):
+        base = day * 24 * 60
+        return Event(name, base + int(start * 60), base + int(end * 60), 1, 1, 'fixed', 'high', day, end - start)
+
+    schedule = [
+        event('c', 10, 12), event('a', 8, 10), event('b', 9, 11),  # chain: a-b dan b-c, a-c hanya bersinggungan
+        event('d', 13, 14), event('e', 14, 15),  # bersinggungan, bukan conflict
+        event('f', 22, 25), event('g', 0.5, 2, day=1), event('h', 0.5, 1, day=1),  # lewat tengah malam
+        event('i', 9, 11, day=2), event('j', 11, 12, day=2), event('k', 10, 11.5, day=2)
+    ]
+    pairwise = [(a.name, b.name) for i, a in enumerate(schedule) for b in schedule[i + 1:]
+                if scheduler.events_overlap(a, b)]
+    swept = [(c['event1'].name, c['event2'].name) for c in scheduler.detect_schedule_conflicts(schedule)]
+
+    assert swept == pairwise
+    assert {('a', 'b'), ('c', 'b')} <= set(swept) and ('c', 'a') not in swept and ('d', 'e') not in swept
+    assert {('f', 'g'), ('f', 'h'), ('g', 'h'), ('i', 'k'), ('j', 'k')} <= set(swept)
+    assert scheduler.detect_schedule_conflicts([event('p', 9, 10), event('q', 10, 11), event('r', 11, 12)]) == []
+    scheduler.close()
+
+def test_history_uses_persistent_wal_connection(tmp_path):
+    """History writes reuse satu connection per thread dalam WAL mode"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    conn = scheduler.get_connection()
+    assert conn is scheduler.get_connection()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    
+    before = scheduler.get_analytics()['total_schedules']
+    schedule = [
+        {'name': 'coding', 'hours': 2, 'priority': 'high'},
+        {'name': 'BREAK', 'hours': 0.25},
+        {'name': 'review', 'hours': 1},
+    ]
+    scheduler.save_schedule_history("coding lalu review", schedule, {'efficiency_score': 80, 'total_hours': 3})
+    schedule_id = conn.execute('SELECT MAX(id) FROM schedules').fetchone()[0]
+    rows = conn.execute('SELECT activity_name, priority FROM activities WHERE schedule_id = ? ORDER BY id', (schedule_id,)).fetchall()
+    assert rows == [('coding', 'high'), ('review', 'medium')]
+    assert scheduler.get_analytics()['total_schedules'] == before + 1
+    
+    scheduler.close()
+    assert scheduler.db_connections == []
+
+def test_history_write_behind_drains_on_close(tmp_path):
+    """Write-behind queue menulis history dalam batch dan drain saat close()"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, history_queue_size=10,
+                                  history_batch_size=4, history_flush_interval=0.05)
+    before = scheduler.get_analytics()['total_schedules']
+    schedule = [{'name': 'coding', 'hours': 1, 'priority': 'high'}]
+    for i in range(9):
+        scheduler.record_history(f"coding {i}", schedule, {'efficiency_score': 70, 'total_hours': 1})
+    
+    scheduler.history_writer.flush()
+    assert scheduler.get_analytics()['total_schedules'] == before + 9
+    
+    scheduler.record_history("coding akhir", schedule, {'efficiency_score': 70, 'total_hours': 1})
+    writer = scheduler.history_writer
+    scheduler.close()
+    assert not writer.thread.is_alive()
+    assert writer.stats()['written'] == 10
+    assert writer.stats()['pending'] == 0
+    
+    reader = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    assert reader.get_analytics()['total_schedules'] == before + 10
+    reader.close()
+
+def test_history_writer_batch_window():
+    """Entry dikumpulkan sampai batch_size / flush_interval, submit() setelah close() ditulis sinkron"""
+    batches = []
+    writer = HistoryWriter(lambda batch: batches.append([entry[0] for entry in batch]), batch_size=2,
+                           flush_interval=30)
+    for name in ('a', 'b', 'c'):
+        writer.submit((name, [], {}))
+    writer.flush()
+    assert batches == [['a', 'b'], ['c']]
+    
+    writer.close()
+    assert not writer.thread.is_alive()
+    writer.submit(('d', [], {}))
+    assert batches[-1] == ['d'] and writer.stats()['sync_writes'] == 1
+    writer.flush()
+
+def test_batch_mode_item_errors_and_single_transaction(tmp_path):
+    """Batch mode: error per item (tidak disimpan), schedule_id per hasil, satu transaction walau lewat queue"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, history_queue_size=10,
+                                  history_batch_size=2, history_flush_interval=30)
+    transactions = []
+    flush_batch = scheduler.history_writer.flush_batch
+    scheduler.history_writer.flush_batch = lambda batch: transactions.append([e[0] for e in batch]) or flush_batch(batch)
+    build = scheduler.build_enhanced_schedule
+    
+    def failing_build(sentence, *args):
+        if sentence == 'boom':
+            raise ValueError('parse failed')
+        return build(sentence, *args)
+    scheduler.build_enhanced_schedule = failing_build
+    
+    sentences = ["besok meeting 2 jam", "", "   ", "boom", "coding 3 jam", "lusa olahraga sore"]
+    results = scheduler.ultimate_enhanced_batch_mode(sentences, date(2031, 6, 2), use_cache=False)
+    assert [result['success'] for result in results] == [True, False, False, False, True, True]
+    assert results[1]['error'] == 'Sentence cannot be empty' and results[3]['error'] == 'parse failed'
+    
+    for sentence, result in zip(sentences, results):
+        if result['success']:
+            stored = scheduler.get_schedule(result['schedule_id'])
+            assert stored['input_text'] == sentence
+            assert [event['name'] for event in stored['schedule']] == [event['name'] for event in result['schedule']]
+        else:
+            assert 'schedule_id' not in result
+    # batch_size 2 tidak memecah batch 3 schedule
+    assert transactions == [["besok meeting 2 jam", "coding 3 jam", "lusa olahraga sore"]]
+    assert scheduler.get_connection().execute('SELECT COUNT(*) FROM schedules').fetchone()[0] == 3
+    scheduler.close()
+
+def test_analytics_rollups_match_full_aggregation(tmp_path):
+    """Rollup tables (incremental & rebuild) sama dengan aggregation langsung dari history"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    schedule = [
+        {'name': 'coding', 'hours': 2, 'priority': 'high'},
+        {'name': 'BREAK', 'hours': 0.25},
+        {'name': 'review', 'hours': 1},
+    ]
+    scheduler.save_schedule_history_batch([
+        ("coding lalu review", schedule, {'efficiency_score': 80, 'total_hours': 3}),
+        ("coding saja", schedule[:1], {'efficiency_score': 60, 'total_hours': 2}),
+    ])
+    
+    conn = scheduler.get_connection()
+    count, avg_efficiency, avg_hours = conn.execute(
+        'SELECT COUNT(*), AVG(productivity_score), AVG(total_hours) FROM schedules').fetchone()
+    coding = conn.execute(
+        "SELECT COUNT(*), AVG(duration) FROM activities WHERE activity_name = 'coding'").fetchone()
+    
+    for _ in range(2):
+        analytics = scheduler.get_analytics()
+        assert analytics['total_schedules'] == count
+        assert abs(analytics['average_efficiency'] - avg_efficiency) < 1e-6
+        assert abs(analytics['average_hours'] - avg_hours) < 1e-6
+        top = {act['name']: act for act in analytics['top_activities']}
+        assert top['coding']['frequency'] == coding[0]
+        assert abs(top['coding']['avg_duration'] - coding[1]) < 1e-6
+        assert 'BREAK' not in top
+        # Backfill dari nol harus menghasilkan angka yang sama
+        conn.execute('DELETE FROM rollup_activities')
+        conn.commit()
+        scheduler.rebuild_rollups()
+    
+    scheduler.close()
+
+def test_analytics_cache_invalidated_on_write(tmp_path):
+    """TTL analytics cache: hit selama tidak ada write, invalidate + ETag baru setelah write"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, analytics_cache_ttl=60)
+    invalidations = scheduler.analytics_cache.stats()['invalidations']
+    first = scheduler.get_analytics_entry()
+    again = scheduler.get_analytics_entry()
+    assert again['etag'] == first['etag']
+    assert scheduler.analytics_cache.stats()['hits'] == 1
+    
+    scheduler.save_schedule_history("coding", [{'name': 'coding', 'hours': 1}],
+                                    {'efficiency_score': 90, 'total_hours': 1})
+    fresh = scheduler.get_analytics_entry()
+    assert fresh['analytics']['total_schedules'] == first['analytics']['total_schedules'] + 1
+    assert fresh['etag'] != first['etag']
+    
+    stats = scheduler.analytics_cache.stats()
+    assert stats['invalidations'] == invalidations + 1
+    assert stats['misses'] == 2
+    assert stats['age'] is not None and stats['age'] < 60
+    scheduler.close()
+
+def test_events_table_indexed_range_queries(tmp_path):
+    """Events tersimpan ter-normalisasi dan query time-range / per-activity pakai index"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    schedule = [
+        {'name': 'meeting', 'start': '2031-03-03T14:00:00', 'end': '2031-03-03T15:00:00', 'priority': 'high'},
+        {'name': 'BREAK', 'start': '2031-03-03T15:00:00', 'end': '2031-03-03T15:15:00', 'priority': 'low'},
+        {'name': 'coding', 'start': '2031-03-03T15:15:00', 'end': '2031-03-03T17:15:00', 'hours': 2},
+    ]
+    scheduler.save_schedule_history("meeting lalu coding", schedule, {'efficiency_score': 75, 'total_hours': 3})
+    
+    window = scheduler.query_events('2031-03-03T14:00:00', '2031-03-03T16:00:00')
+    assert [event['name'] for event in window] == ['meeting', 'BREAK', 'coding']
+    coding = scheduler.query_events('2031-03-03T00:00:00', '2031-03-04T00:00:00', 'coding')
+    assert [(event['start'], event['hours']) for event in coding] == [('2031-03-03T15:15:00', 2)]
+    
+    conn = scheduler.get_connection()
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT * FROM events WHERE activity_name = ? AND start_time >= ?',
+                        ('coding', '2031-03-03')).fetchall()
+    assert 'idx_events_activity_start' in ' '.join(row[-1] for row in plan)
+    scheduler.close()
+
+def test_history_keyset_pagination_and_stream(tmp_path):
+    """Cursor pagination melewati semua schedule tepat sekali, iter_history streaming per chunk"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    start_id = scheduler.get_connection().execute('SELECT COALESCE(MAX(id), 0) FROM schedules').fetchone()[0]
+    scheduler.save_schedule_history_batch([
+        (f"coding {i}", [{'name': 'coding', 'start': f'2031-04-0{i + 1}T09:00:00',
+                          'end': f'2031-04-0{i + 1}T10:00:00', 'hours': 1}],
+         {'efficiency_score': 70, 'total_hours': 1})
+        for i in range(5)
+    ])
+    
+    seen = []
+    cursor = start_id
+    while True:
+        page = scheduler.get_history_page(cursor, limit=2)
+        seen.extend(page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert [item['input_text'] for item in seen] == [f"coding {i}" for i in range(5)]
+    assert seen[0]['schedule'][0]['start'] == '2031-04-01T09:00:00'
+    
+    streamed = list(scheduler.iter_history(start_id, chunk_size=2))
+    assert [item['id'] for item in streamed] == [item['id'] for item in seen]
+    scheduler.close()
+
+def test_bulk_import_ndjson_and_csv(tmp_path):
+    """Bulk import: record valid masuk (events, activities, rollups), record invalid dilaporkan per baris"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, tz="Asia/Jakarta")
+    before = scheduler.get_analytics()['total_schedules']
+    ndjson_lines = [
+        json.dumps({'input_text': 'migrasi 1', 'created_at': '2031-05-01T08:00:00', 'schedule': [
+            {'name': 'laporan', 'start': '2031-05-01T09:00:00', 'end': '2031-05-01T11:00:00', 'priority': 'high'},
+            {'name': 'BREAK', 'start': '2031-05-01T11:00:00', 'end': '2031-05-01T11:15:00',
+             'session': '-', 'total_sessions': '-', 'type': 'break', 'priority': 'low'},
+        ]}) + "\n",
+        "\n",
+        json.dumps({'input_text': 'rusak', 'schedule': [
+            {'name': 'x', 'start': '2031-05-01T10:00:00', 'end': '2031-05-01T09:00:00'}]}) + "\n",
+        "{not json\n",
+    ]
+    summary = scheduler.import_history(ndjson_lines, 'ndjson', chunk_size=1)
+    assert summary['imported'] == 1 and summary['failed'] == 2
+    assert [error['line'] for error in summary['errors']] == [3, 4]
+    
+    csv_lines = [
+        "schedule_ref,input_text,name,start,end,priority,hours\n",
+        "a,migrasi 2,desain,2031-05-02T09:00:00,2031-05-02T10:30:00,medium,1.5\n",
+        "a,migrasi 2,review,2031-05-02T13:00:00,2031-05-02T14:00:00,low,\n",
+        "b,migrasi 3,desain,2031-05-03T09:00:00,2031-05-03T10:00:00,urgent,1\n",
+    ]
+    summary = scheduler.import_history(csv_lines, 'csv')
+    assert summary['imported'] == 1 and summary['failed'] == 1
+    assert 'priority' in summary['errors'][0]['error']
+    
+    events = scheduler.query_events('2031-05-01T00:00:00', '2031-05-03T00:00:00')
+    assert [event['name'] for event in events] == ['laporan', 'BREAK', 'desain', 'review']
+    assert scheduler.get_analytics()['total_schedules'] == before + 2
+    
+    conn = scheduler.get_connection()
+    created = conn.execute("SELECT created_at FROM schedules WHERE input_text = 'migrasi 1'").fetchone()[0]
+    assert created == '2031-05-01 08:00:00'
+    
+    # id dari AUTOINCREMENT (id yang sudah dihapus tidak dipakai ulang); offset dikonversi ke Asia/Jakarta
+    scheduler.save_schedule_history("hapus", [{'name': 'x', 'hours': 1}], {'efficiency_score': 1, 'total_hours': 1})
+    deleted_id = conn.execute('SELECT MAX(id) FROM schedules').fetchone()[0]
+    conn.execute('DELETE FROM activities WHERE schedule_id = ?', (deleted_id,))
+    conn.execute('DELETE FROM schedules WHERE id = ?', (deleted_id,))
+    conn.commit()
+    offset_line = json.dumps({'input_text': 'migrasi 4', 'schedule': [
+        {'name': 'sync', 'start': '2031-05-04T02:00:00+00:00', 'end': '2031-05-04T03:30:00+00:00'}]})
+    assert scheduler.import_history([offset_line], 'ndjson')['imported'] == 1
+    imported_id = conn.execute("SELECT id FROM schedules WHERE input_text = 'migrasi 4'").fetchone()[0]
+    assert imported_id > deleted_id
+    synced = scheduler.query_events('2031-05-04T09:00:00', '2031-05-04T10:00:00')
+    assert [(event['name'], event['start'], event['end']) for event in synced] == \
+        [('sync', '2031-05-04T09:00:00', '2031-05-04T10:30:00')]
+    conn.execute("DELETE FROM events WHERE start_time LIKE '2031-05-0%'")
+    conn.commit()
+    scheduler.close()
+
+def test_result_cache_keyed_by_sentence_and_reference_date(tmp_path):
+    """Result cache: hit untuk sentence ter-normalisasi + tanggal sama, miss untuk tanggal lain / bypass"""
+    frozen = datetime(2031, 6, 2, 23, 59)  # Senin
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, result_cache_size=8,
+                                  clock=lambda: frozen)
+    
+    first = scheduler.ultimate_enhanced_blitz_mode("setiap senin rapat team 2 jam")
+    assert first['schedule'][0]['start'].startswith('2031-06-02')
+    again = scheduler.ultimate_enhanced_blitz_mode("  Setiap Senin rapat team 2 jam ")
+    assert again.pop('schedule_id') != first.pop('schedule_id')  # history row baru per request
+    assert again == first
+    again['schedule'].clear()  # copy per hit
+    assert scheduler.result_cache.stats()['hits'] == 1
+    
+    scheduler.ultimate_enhanced_blitz_mode("setiap senin rapat team 2 jam", use_cache=False)
+    next_week = scheduler.ultimate_enhanced_blitz_mode("setiap senin rapat team 2 jam", date(2031, 6, 3))
+    assert next_week['schedule'][0]['start'].startswith('2031-06-09')
+    stats = scheduler.result_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 2, 2)
+    scheduler.close()
+
+def test_injected_clock_and_timezone(tmp_path, capsys):
+    """Clock + tz menentukan reference date dan created_at history secara konsisten"""
+    frozen = datetime(2031, 6, 1, 20, 30, tzinfo=timezone.utc)  # 2 Juni 03:30 di Jakarta
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, clock=lambda: frozen)
+    assert scheduler.today() == date(2031, 6, 1)
+    assert scheduler.today('Asia/Jakarta') == date(2031, 6, 2)
+    
+    result = scheduler.ultimate_enhanced_blitz_mode("besok coding 2 jam", tz='Asia/Jakarta')
+    assert result['schedule'][0]['start'] == '2031-06-03T09:00:00'
+    
+    conn = scheduler.get_connection()
+    created_at = conn.execute('SELECT created_at FROM schedules ORDER BY id DESC LIMIT 1').fetchone()[0]
+    assert created_at == '2031-06-01 20:30:00'
+    scheduler.close()
+    
+    # Console rendering memakai reference_date request, bukan hari ini
+    console = UltimateScheduler(db_path=tmp_path / "history.db", clock=lambda: frozen)
+    capsys.readouterr()
+    console.ultimate_enhanced_blitz_mode("besok coding 2 jam", date(2031, 7, 14), use_cache=False)
+    output = capsys.readouterr().out
+    assert "📅 Tuesday, 15 July 2031" in output and "2031-06" not in output
+    console.close()
+
+def test_lazy_recurrence_over_long_horizon(tmp_path):
+    """Recurrence RRULE-style: occurrences lazy, horizon per request"""
+    monday = date(2031, 6, 2)
+    weekly = Recurrence.from_pattern({'type': 'weekly', 'days': ['monday', 'friday']}, monday)
+    assert weekly.to_rrule() == 'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,FR'
+    occurrences = weekly.occurrences(monday, monday + timedelta(days=365))
+    assert next(occurrences) == monday
+    assert next(occurrences) == date(2031, 6, 6)
+    assert sum(1 for _ in occurrences) == 53 + 52 - 2  # 53 senin + 52 jumat
+    
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    activities, _, pattern, _ = scheduler.context_aware_parse("setiap senin rapat team 2 jam")
+    plans = scheduler.recurring_day_plans(activities, Recurrence.from_pattern(pattern, monday), monday, 365)
+    day_offset, day_activities = next(plans)
+    assert day_offset == 0 and day_activities[0].recurring_instance
+    
+    result = scheduler.build_enhanced_schedule("setiap senin rapat team 2 jam", monday, horizon_days=91)
+    days = sorted({event.day_offset for event in result['schedule']})
+    assert days == list(range(0, 91, 7))
+    scheduler.close()
+
+def test_parallel_day_scheduling_matches_serial(tmp_path):
+    """Day pool menghasilkan schedule yang sama dengan serial path, request kecil tetap in-process"""
+    sentence = "setiap hari belajar 2 jam 2 sesi, kerja 3 jam, sholat"
+    monday = date(2031, 6, 2)
+    serial = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    parallel = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, day_workers=2,
+                                 parallel_day_threshold=10)
+    
+    small = parallel.build_enhanced_schedule(sentence, monday, horizon_days=3)
+    assert parallel.day_pool is None
+    
+    expected = serial.serialize_result(serial.build_enhanced_schedule(sentence, monday, horizon_days=40), monday)
+    actual = parallel.serialize_result(parallel.build_enhanced_schedule(sentence, monday, horizon_days=40), monday)
+    assert parallel.day_pool is not None
+    assert actual == expected
+    assert len(small['schedule']) < len(actual['schedule'])
+    
+    serial.close()
+    parallel.close()
+    assert parallel.day_pool is None
+
+def test_incremental_schedule_edits(tmp_path):
+    """PATCH-style add / move / remove: diff, neighbour conflicts dan metrics delta tanpa rebuild"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, tz="Asia/Jakarta")
+    result = scheduler.ultimate_enhanced_blitz_mode("besok meeting jam 9-11, belajar 2 jam", date(2031, 6, 2),
+                                                    use_cache=False)
+    uid = result['schedule_id']
+    stored = scheduler.get_schedule(uid)
+    assert [event['name'] for event in stored['schedule']] == [event['name'] for event in result['schedule']]
+    first = stored['schedule'][0]
+    assert first['start'] == '2031-06-03T09:00:00' and first['end'] == '2031-06-03T11:00:00'
+    total_hours = stored['metrics']['total_hours']
+    
+    added = scheduler.edit_schedule(uid, {'op': 'add', 'name': 'review', 'start': '2031-06-03T10:30:00', 'hours': 1})
+    review = added['added'][0]
+    assert review['end'] == '2031-06-03T11:30:00' and review['day_offset'] == first['day_offset']
+    assert [conflict['with_event_id'] for conflict in added['conflicts']] == [first['id']]
+    assert added['metrics']['total_hours'] == total_hours + 1
+    
+    moved = scheduler.edit_schedule(uid, {'op': 'move', 'event_id': review['id'], 'start': '2031-06-03T22:00:00'})
+    assert moved['moved'][0]['to'] == {'start': '2031-06-03T22:00:00', 'end': '2031-06-03T23:00:00'}
+    assert moved['conflicts'] == [] and moved['metrics']['total_hours'] == total_hours + 1
+    
+    removed = scheduler.edit_schedule(uid, {'op': 'remove', 'event_id': review['id']})
+    assert removed['removed'][0]['id'] == review['id']
+    assert abs(removed['metrics']['total_hours'] - total_hours) < 1e-9
+    assert [event['id'] for event in scheduler.get_schedule(uid)['schedule']] == \
+        [event['id'] for event in stored['schedule']]
+    
+    try:
+        scheduler.edit_schedule(uid, {'op': 'remove', 'event_id': review['id']})
+        assert False, "expected KeyError"
+    except KeyError:
+        pass
+    try:
+        scheduler.edit_schedule(uid, {'op': 'add', 'name': 'x', 'start': '2031-06-03T10:00:00'})
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert scheduler.get_schedule('missing') is None
+    
+    # Move dengan end eksplisit: 2 jam -> 3.5 jam, metrics + activities + rollups ikut
+    resized = scheduler.edit_schedule(uid, {'op': 'move', 'event_id': first['id'], 'start': '2031-06-03T13:00:00',
+                                            'end': '2031-06-03T16:30:00'})
+    assert abs(resized['metrics']['total_hours'] - (total_hours + 1.5)) < 1e-9
+    conn = scheduler.get_connection()
+    assert conn.execute('SELECT total_hours FROM schedules WHERE uid = ?', (uid,)).fetchone()[0] == total_hours + 1.5
+    assert conn.execute("SELECT duration FROM activities WHERE activity_name = 'belajar'").fetchone()[0] == 3.5
+    analytics = scheduler.get_analytics()
+    scheduler.rebuild_rollups()
+    assert scheduler.get_analytics() == analytics
+    
+    # Offset dikonversi ke timezone scheduler (Asia/Jakarta, +07:00) dan disimpan naive seperti event lain
+    shifted = scheduler.edit_schedule(uid, {'op': 'add', 'name': 'call', 'start': '2031-06-03T09:00:00+00:00',
+                                            'end': '2031-06-03T16:45:00'})
+    call = shifted['added'][0]
+    assert (call['start'], call['end']) == ('2031-06-03T16:00:00', '2031-06-03T16:45:00')
+    assert [conflict['with_event_id'] for conflict in shifted['conflicts']] == [first['id']]
+    
+    # Event panjang yang mulai lebih awal tetap terdeteksi walau ada event lain di antaranya
+    kerja = scheduler.edit_schedule(uid, {'op': 'add', 'name': 'kerja', 'start': '2031-06-05T09:00:00', 'hours': 8})
+    scheduler.edit_schedule(uid, {'op': 'add', 'name': 'call', 'start': '2031-06-05T10:00:00', 'hours': 0.5})
+    review = scheduler.edit_schedule(uid, {'op': 'add', 'name': 'review', 'start': '2031-06-05T12:00:00', 'hours': 1})
+    assert [conflict['with'] for conflict in review['conflicts']] == ['kerja']
+    assert review['conflicts'][0]['with_event_id'] == kerja['added'][0]['id']
+    
+    # Session yang lewat tengah malam dari hari sebelumnya ikut dicek
+    scheduler.edit_schedule(uid, {'op': 'add', 'name': 'deploy', 'start': '2031-06-06T22:45:00', 'hours': 2})
+    early = scheduler.edit_schedule(uid, {'op': 'add', 'name': 'backup', 'start': '2031-06-07T00:15:00', 'hours': 0.5})
+    assert [(conflict['with'], conflict['start'], conflict['end']) for conflict in early['conflicts']] == \
+        [('deploy', '2031-06-07T00:15:00', '2031-06-07T00:45:00')]
+    scheduler.close()
+
+def test_schedule_lookup_waits_only_for_its_uid(tmp_path):
+    """GET / PATCH untuk uid yang tidak pernah di-submit tidak men-drain write-behind queue"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True, history_queue_size=10,
+                                  history_flush_interval=30)
+    waits = []
+    wait_for = scheduler.history_writer.wait_for
+    scheduler.history_writer.wait_for = lambda key, timeout: waits.append(key) or wait_for(key, timeout)
+    
+    assert scheduler.get_schedule('missing') is None
+    
+    uid = scheduler.record_history("coding", [{'name': 'coding', 'hours': 1}], {'efficiency_score': 1, 'total_hours': 1})
+    assert scheduler.history_writer.is_pending(uid)
+    assert scheduler.get_schedule(uid)['schedule_id'] == uid
+    assert waits == ['missing', uid] and not scheduler.history_writer.is_pending(uid)
+    scheduler.close()
+    
+    # Lookup hanya menunggu uid-nya sendiri, tidak entry yang masuk (atau masih ditulis) setelahnya
+    gate = threading.Event()
+    writer = HistoryWriter(lambda batch: batch[0][0] != 'b' or gate.wait(5), batch_size=1, flush_interval=30,
+                           key=lambda entry: entry[0])
+    writer.submit(('a', [], {}))
+    writer.submit(('b', [], {}))
+    writer.submit(('c', [], {}))
+    started = monotonic()
+    assert writer.wait_for('a', timeout=2) and monotonic() - started < 1
+    assert not writer.wait_for('c', timeout=0.05)
+    gate.set()
+    assert writer.wait_for('c', timeout=2)
+    writer.close()
+
+def test_optimal_placement_honours_preferences_within_budget(tmp_path):
+    """Optimal placement engine: preferred_time / 'jam X-Y' / time of day dipakai, deadline selalu dihormati"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    sentence = "besok urgent presentasi 2 jam, rapat team 1 jam, santai nanti coding 2 jam"
+    greedy = scheduler.build_enhanced_schedule(sentence, date(2031, 6, 2))
+    optimal = scheduler.build_enhanced_schedule(sentence, date(2031, 6, 2), placement_budget_ms=50)
+    assert [scheduler.clock_str(event.start_min) for event in greedy['schedule']] == ['09:00', '11:00', '13:00']
+    # work -> afternoon, creative -> night
+    assert {event.name: scheduler.clock_str(event.start_min) for event in optimal['schedule']} == \
+        {'presentasi': '12:00', 'rapat team': '14:00', 'santai nanti coding': '18:00'}
+    assert optimal['conflicts_resolved'] == 0
+    
+    olahraga = scheduler.build_enhanced_schedule("besok olahraga sore", date(2031, 6, 2), placement_budget_ms=50)
+    assert scheduler.clock_str(olahraga['schedule'][0].start_min) == '17:00'
+    
+    # Deadline sudah lewat: incumbent greedy langsung dipakai, tetap jadwal lengkap tanpa overlap
+    activities = [Activity(f'task{i}', 0.75, 2, ['high', 'medium', 'low'][i % 3], 'regular') for i in range(10)]
+    report = {'timed_out': False}
+    schedule = optimize_day(activities, 0, [(9 * 60, 11 * 60)], monotonic() - 1, report)
+    assert report['timed_out']
+    flexible = [event for event in schedule if event.type == 'flexible']
+    assert len(flexible) == 20
+    assert all(a.end_min <= b.start_min for a, b in zip(schedule, schedule[1:]))
+    assert [event.session for event in flexible if event.name == 'task0'] == [1, 2]
+    assert any(event.name == 'task0' and 9 * 60 <= event.start_min < 11 * 60 for event in flexible)
+    
+    # Hari sangat padat (recursion depth): tanpa search, incumbent greedy dipakai utuh
+    report = {'timed_out': False}
+    dense = optimize_day([Activity('coding', 1, 1200, 'medium', 'regular')], 0, (), monotonic() + 0.1, report)
+    assert [event.session for event in dense if event.type == 'flexible'] == list(range(1, 1201))
+    assert not report['timed_out']
+    assert all(a.end_min <= b.start_min for a, b in zip(dense, dense[1:]))
+    busy = optimize_day([Activity('coding', 0.25, 200, 'medium', 'regular')], 0, (), monotonic() + 0.1)
+    assert len([event for event in busy if event.type == 'flexible']) == 200
+    
+    # Search yang selesai sebelum deadline deterministik dan boleh di-cache
+    assert optimal['placement'] == {'engine': 'optimal', 'timed_out': False}
+    assert scheduler.cacheable(scheduler.serialize_result(optimal, date(2031, 6, 2)))
+    assert not scheduler.cacheable({'placement': {'engine': 'optimal', 'timed_out': True}})
+    scheduler.close()
+
+def test_conflict_resolution_gap_index(tmp_path):
+    """Event di banyak conflict dipindah sekali, satu gap tidak dibagi ke dua event, slot tetap di hari yang sama"""
+    scheduler = UltimateScheduler(db_path=tmp_path / "history.db", headless=True)
+    
+    def event(name, start, end, day=0):
+        base = day * 24 * 60
+        return Event(name, base + scheduler.clock_minutes(start), base + scheduler.clock_minutes(end), 1, 1, 'fixed',
+                     'high', day, (scheduler.clock_minutes(end) - scheduler.clock_minutes(start)) / 60)
+    
+    schedule = [event('a', '09:00', '10:00'), event('b', '09:30', '10:30'), event('c', '09:45', '10:15'),
+                event('d', '11:00', '12:00'), event('e', '13:00', '14:00'), event('f', '08:00', '09:00', day=1),
+                event('g', '10:00', '11:00', day=1)]
+    conflicts = scheduler.detect_schedule_conflicts(schedule)
+    assert len(conflicts) == 3
+    
+    resolved, suggestions = scheduler.resolve_conflicts(schedule, conflicts)
+    assert sorted(item.name for item in resolved) == ['a', 'b', 'c', 'd', 'e', 'f', 'g']
+    moved = {item.name: scheduler.clock_str(item.start_min) for item in resolved if item.conflict_resolved}
+    # Waktu kosong sebelum event pertama (mulai 06:00) ikut jadi gap; 'a' dipindah sekali walau ada di dua conflict
+    assert moved == {'a': '06:00', 'b': '07:00'}
+    assert len(suggestions) == 2
+    assert not any(scheduler.events_overlap(item, other) for item in resolved for other in resolved if other is not item)
+    
+    # Slot lama 'x' (06:00-07:00 yang tidak tertutup 'y') dikembalikan ke index dan dipakai 'z'
+    day = [event('x', '06:00', '08:00'), event('y', '07:00', '08:00'), event('f1', '08:00', '20:00'),
+           event('z', '22:00', '23:00'), event('w', '22:00', '23:00'), event('f2', '23:00', '23:59')]
+    resolved, suggestions = scheduler.resolve_conflicts(day, scheduler.detect_schedule_conflicts(day))
+    moved = {item.name: scheduler.clock_str(item.start_min) for item in resolved if item.conflict_resolved}
+    assert moved == {'x': '20:00', 'z': '06:00'}
+    assert not any(scheduler.events_overlap(item, other) for item in resolved for other in resolved if other is not item)
+    
+    # Hari penuh: slot tidak boleh lewat tengah malam ke hari berikutnya
+    day = [event('p', '06:00', '23:00', day=1), event('q', '22:00', '23:00', day=1),
+           event('r', '22:00', '23:00', day=1)]
+    resolved, suggestions = scheduler.resolve_conflicts(day, scheduler.detect_schedule_conflicts(day))
+    assert scheduler.find_alternative_slots(day[1], day) == [
+        {'start_min': 24 * 60 + 23 * 60, 'end_min': 2 * 24 * 60, 'gap_hours': 1.0, 'reason': 'Available gap'}]
+    moved = [(item.name, scheduler.clock_str(item.start_min), item.start_min // (24 * 60))
+             for item in resolved if item.conflict_resolved]
+    assert moved == [('q', '23:00', 1)]
+    assert sum('manually' in suggestion for suggestion in suggestions) == 2  # 'p' (17 jam) tidak muat di mana pun
+    scheduler.close()
+
 if __name__ == "__main__":
-    test_enhanced_features()
\ No newline at end of file
+    test_enhanced_features()